@@ -1,23 +1,141 @@
+import re
+from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional
 
 class Settings(BaseSettings):
-    # API Keys
-    MISTRAL_API_KEY: str
-    MISTRAL_AGENT_IMAGE_PROMPT: str
-    ELEVEN_API_KEY: str
-    ELEVEN_VOICE_ID: str
-    GLADIA_API_KEY: str
-    SEELAB_API_KEY: str
-
-    # Base URLs and endpoints
+    # API Keys (checked when a provider client is first used, so CPU-only
+    # workers can run without them)
+    MISTRAL_API_KEY: str = ""
+    MISTRAL_AGENT_IMAGE_PROMPT: str = ""
+    ELEVEN_API_KEY: str = ""
+    GLADIA_API_KEY: str = ""
+    SEELAB_API_KEY: str = ""
+
+    # Base URLs and endpoints (point them at local stubs in tests)
+    MISTRAL_BASE_URL: str = "https://api.mistral.ai"
+    ELEVEN_BASE_URL: str = "https://api.elevenlabs.io"
     GLADIA_BASE_URL: str = "https://api.gladia.io/v2/"
+    SEELAB_BASE_URL: str = "https://app.seelab.ai/api/"
+    GLADIA_POLL_SECONDS: float = 1
+
+    # Provider rate limits (requests per second, adapted with AIMD on 429)
+    MISTRAL_RATE_LIMIT: float = 1.0
+    ELEVEN_RATE_LIMIT: float = 2.0
+    GLADIA_RATE_LIMIT: float = 2.0
+    SEELAB_RATE_LIMIT: float = 2.0
+    RATE_LIMIT_MAX_FACTOR: float = 4.0
+    RATE_LIMIT_INCREASE: float = 0.05
+    RATE_LIMIT_DECREASE: float = 0.5
+    RATE_LIMIT_MAX_RETRIES: int = 5
+
+    # Shared HTTP transport
+    HTTP2_ENABLED: bool = True
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 20
+    HTTP_KEEPALIVE_SECONDS: float = 30
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 10
+    HTTP_TIMEOUT_SECONDS: float = 60
+    MISTRAL_TIMEOUT_SECONDS: float = 120
+    ELEVEN_TIMEOUT_SECONDS: float = 120
+    GLADIA_TIMEOUT_SECONDS: float = 120
+    SEELAB_TIMEOUT_SECONDS: float = 180
+
+
+    # Build provider clients and agents at startup instead of on first use
+    WARM_UP_PROVIDERS: bool = False
 
+    # Task artifacts: per-task directories over content-addressed blobs
+    ARTIFACT_DIR: str = "./artifacts"
+    ARTIFACT_MAX_BYTES: int = 20 * 1024 * 1024 * 1024
+    ARTIFACT_GC_INTERVAL_SECONDS: float = 600
+    # Task directories without any record are removed once this old
+    ARTIFACT_ORPHAN_GRACE_SECONDS: float = 3600
+
+    # Content-addressed caches of generated assets
+    ASSET_CACHE_DIR: str = "./cache"
+    IMAGE_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    AUDIO_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
 
     # Model settings
     MISTRAL_MODEL: str = "mistral-large-latest"
     ELEVEN_VOICE_ID: str = "Josh"
     ELEVEN_MODEL: str = "eleven_monolingual_v1"
+    # Constant-bitrate mp3, so durations follow from the byte count
+    ELEVEN_OUTPUT_FORMAT: str = "mp3_44100_128"
+    SEELAB_STYLE_ID: int = 1003  # Flux HD
+    SEELAB_SEED: int = 0
+    SEELAB_ASPECT_RATIO: str = "1:1"
+
+    # Pipeline concurrency (max in-flight calls per provider)
+    CHAPTER_CONCURRENCY: int = 4
+    MISTRAL_CONCURRENCY: int = 4
+    ELEVEN_CONCURRENCY: int = 2
+    GLADIA_CONCURRENCY: int = 2
+    SEELAB_CONCURRENCY: int = 4
+
+    # Uploads
+    UPLOAD_MAX_BYTES: int = 100 * 1024 * 1024
+    # Allowance for multipart boundaries and form fields on top of UPLOAD_MAX_BYTES
+    UPLOAD_MULTIPART_OVERHEAD_BYTES: int = 64 * 1024
+
+    # PDF extraction (0 workers means one per CPU)
+    PDF_WORKERS: int = 0
+    PDF_BATCH_PAGES: int = 20
+
+    # SQLite database (defaults to backend/tasks.db) and connection pool
+    DB_PATH: str = ""
+    DB_POOL_SIZE: int = 4
+    DB_WRITE_BATCH_SIZE: int = 500
+
+    # Background job queue
+    JOB_WORKERS: int = 2
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: float = 5
+    JOB_HEARTBEAT_SECONDS: float = 5
+    JOB_STALE_SECONDS: float = 60
+    JOB_POLL_SECONDS: float = 1
+
+    # Video rendering (0 means derive from the CPU count)
+    RENDER_WORKERS: int = 0
+    RENDER_THREADS_PER_JOB: int = 0
+    FFMPEG_BINARY: str = "ffmpeg"
+    FFPROBE_BINARY: str = "ffprobe"
+    VIDEO_WIDTH: int = 1080
+    VIDEO_HEIGHT: int = 1920
+    VIDEO_FPS: int = 25
+    VIDEO_PRESET: str = "veryfast"
+    # Moov atom up front so playback starts before the download ends; use
+    # "+frag_keyframe+empty_moov+default_base_moof" for fragmented output
+    VIDEO_MOVFLAGS: str = "+faststart"
+    # Let a fronting nginx serve videos with sendfile (e.g. "/protected-artifacts/")
+    VIDEO_ACCEL_REDIRECT_PREFIX: str = ""
+    # Subtitle timing: "alignment" (TTS timestamps, estimated from the script
+    # when missing), "script" (estimate only) or "gladia" (transcribe the audio)
+    SUBTITLE_TIMING: str = "alignment"
+    SUBTITLE_STYLE: str = "FontName=Helvetica,FontSize=14,PrimaryColour=&H00FFFFFF,Outline=2,Alignment=2,MarginV=60"
+
+    # Subject extraction over document chunks (sizes in estimated tokens)
+    SUBJECT_CHUNK_TOKENS: int = 8000
+    SUBJECT_CONCURRENCY: int = 4
+    SUBJECT_MERGE_WITH_LLM: bool = True
+
+    # Task status endpoint
+    PROGRESS_RETENTION_SECONDS: float = 3600
+    STATUS_LONG_POLL_MAX_SECONDS: float = 30
+    STATUS_SSE_HEARTBEAT_SECONDS: float = 15
+    # How often the stored status is re-read for tasks running in another process
+    PROGRESS_REFRESH_SECONDS: float = 5
+
+    # Metrics at /metrics and spans around service calls (set before startup;
+    # disabled leaves the services unwrapped)
+    METRICS_ENABLED: bool = True
+    # Print every finished span as a JSON line
+    TRACE_LOG_SPANS: bool = False
+    EVENT_LOOP_LAG_INTERVAL_SECONDS: float = 0.5
+
+    # LLM response cache
+    LLM_CACHE_MAX_ENTRIES: int = 10000
+    LLM_CACHE_MAX_AGE_SECONDS: int = 30 * 24 * 3600
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -25,5 +143,20 @@ class Settings(BaseSettings):
         case_sensitive=True
     )
 
+    @field_validator("ELEVEN_OUTPUT_FORMAT")
+    @classmethod
+    def _check_output_format(cls, value: str) -> str:
+        # Voiceover durations are computed from the byte count, which pcm or ulaw would break
+        if not re.fullmatch(r"mp3_\d+_\d+", value):
+            raise ValueError(f"must be a constant-bitrate mp3 format such as mp3_44100_128, got {value!r}")
+        return value
+
+    def require(self, name: str) -> str:
+        """Return a setting that must be configured, such as an API key"""
+        value = getattr(self, name)
+        if not value:
+            raise RuntimeError(f"{name} is not configured")
+        return value
+
 # Create global settings instance
 settings = Settings()
@@ -1,16 +1,31 @@
 import uuid
-from fastapi import FastAPI, HTTPException, UploadFile, File, WebSocket, WebSocketDisconnect
+import json
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import asyncio
 import os
 import glob
 
-from .services.file_service import FileProcessor
+from .services.file_service import FileProcessor, FileTooLargeError, InvalidUploadError, shutdown_extraction_pool
 from .services.ai_service import AIProcessor
 from .services.video_service import VideoProcessor
 from .services.db_service import db_service
+from .config import settings
+from .services.pipeline_service import PipelineScheduler
+from .services.job_service import PermanentJobError, job_queue
+from .services.render_service import render_pool
+from .services.http_service import http_pool
+from .services.progress_service import progress_store
+from .services.cache_service import llm_cache
+from .services.asset_cache_service import audio_cache, image_cache
+from .services.artifact_service import artifact_store
+from .services.delivery_service import video_response
+from .services.rate_limit_service import rate_limiters
+from .services import metrics_service
+from .services.metrics_service import log_event, metrics
 
 app = FastAPI()
 
@@ -26,6 +41,28 @@ app.add_middleware(
 file_processor = FileProcessor()
 ai_processor = AIProcessor()
 video_processor = VideoProcessor()
+pipeline_scheduler = PipelineScheduler(ai_processor, video_processor)
+
+@app.on_event("startup")
+async def startup():
+    if settings.WARM_UP_PROVIDERS:
+        # SDK imports are slow and blocking; keep them off the event loop
+        await asyncio.to_thread(ai_processor.warm_up)
+    job_queue.register("process_chapters", process_chapters_job)
+    job_queue.start()
+    artifact_store.start()
+    metrics.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await metrics.stop()
+    await job_queue.stop()
+    await artifact_store.stop()
+    await render_pool.stop()
+    await http_pool.aclose()
+    shutdown_extraction_pool()
+    db_service.close()
 
 class ProcessingRequest(BaseModel):
     content_type: str  # "VS", "Key Moment", "Key Character", "Quiz"
@@ -39,75 +76,122 @@ class UploadResponse(BaseModel):
 
 @app.get("/api/test")
 async def test():
-    task_path = "./artifacts/sample"
+    # Sample prompts are read-only fixtures; generated images go to a fresh task
     image_prompts = []
-    for filepath in glob.glob(os.path.join(task_path, "image_prompt_*.txt")):
+    for filepath in glob.glob(os.path.join(settings.ARTIFACT_DIR, "sample", "image_prompt_*.txt")):
         with open(filepath, "r") as f:
             image_prompts.append(f.read())
+    task_id = str(uuid.uuid4())
+    task_path = artifact_store.task_path(task_id)
     # Generate image for each prompt
-    for idx, prompt in enumerate(image_prompts):
-        print("generating image for", idx, prompt)
-        image_path = await ai_processor.generate_image(prompt, f"image_{idx}.png", task_path)
-        print(image_path)
+    try:
+        for idx, prompt in enumerate(image_prompts):
+            print("generating image for", idx, prompt)
+            image_path = await ai_processor.generate_image(prompt, f"image_{idx}.png", task_path)
+            print(image_path)
+    except BaseException:
+        await artifact_store.discard(task_id)
+        raise
 
     # subtitles = open("./artifacts/sample/test.srt", "r").read()
     # srt_dict = await ai_processor.format_srt_to_dict(subtitles)
-    # await export_subjects_to_image_prompts(srt_dict)
+    # await export_subjects_to_image_prompts(srt_dict, task_id)
 
     return {"message": "ok"}
 
-@app.post("/api/upload")
-async def upload_file(
-    file: UploadFile = File(...)
-):
+UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "properties": {"file": {"type": "string", "format": "binary"}},
+        "required": ["file"],
+    }}},
+}
+
+
+@app.post("/api/upload", openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def upload_file(request: Request, task_id: Optional[str] = None):
+    """Store a document and list its subjects; a client-chosen task_id lets it follow extraction on /api/status"""
+    reserved = False
+    extract_step = None
+    adopted = False
     try:
-        # Validate file
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="No file name provided")
-
-        # Check file size (optional, example limit of 100MB)
-        file.file.seek(0, 2)  # Go to end of file
-        file_size = file.file.tell()
-        file.file.seek(0)  # Reset file pointer
-
-        if file_size > 100 * 1024 * 1024:  # 100 MB
-            raise HTTPException(status_code=413, detail="File too large. Maximum size is 100MB")
-
-        # Generate a unique task ID
-        task_id = str(uuid.uuid4())
-        task_path  = f"./artifacts/{task_id}"
-        os.makedirs(task_path, exist_ok=True)
-
-        # Save uploaded file temporarily
-
-        temp_path = f"{task_path}/{file.filename}"
+        # Refuse oversized bodies before reading any of them
+        content_length = request.headers.get("content-length", "")
+        max_body = settings.UPLOAD_MAX_BYTES + settings.UPLOAD_MULTIPART_OVERHEAD_BYTES
+        if content_length.isdigit() and int(content_length) > max_body:
+            raise HTTPException(status_code=413, detail=str(FileTooLargeError(settings.UPLOAD_MAX_BYTES)))
+
+        # Generate a unique task ID unless the client picked one
+        if task_id is None:
+            task_id = str(uuid.uuid4())
+        else:
+            try:
+                task_id = str(uuid.UUID(task_id))
+            except ValueError:
+                raise HTTPException(status_code=400, detail="task_id must be a UUID")
+        # Inserting the task row reserves the id, so concurrent uploads cannot share it
+        if not await db_service.reserve_task(task_id):
+            raise HTTPException(status_code=409, detail="Task already exists")
+        reserved = True
+        task_path = artifact_store.task_path(task_id)
+
+        # Parse the body off the wire, writing and hashing the file in one pass
         try:
-            with open(temp_path, "wb") as buffer:
-                buffer.write(await file.read())
-                buffer.close()
+            temp_path, _, file_hash = await file_processor.receive_upload(
+                request.stream(),
+                request.headers.get("content-type", ""),
+                task_path,
+                max_size=settings.UPLOAD_MAX_BYTES
+            )
+        except FileTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except InvalidUploadError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except IOError as e:
             raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
+        filename = os.path.basename(temp_path)
+
+        # Reuse extraction and subjects from an identical earlier upload
+        document = await db_service.get_document(file_hash)
 
         # Process file and split into chapters
         try:
-            content = await file_processor.process_file(temp_path)
-            chapters_of_subject = await ai_processor.generact_list_of_subjects(content)
-            print(chapters_of_subject)
+            if document:
+                chapters_of_subject = document["chapters"]
+            else:
+                extract_step = "Extracting document"
+                progress_store.start(task_id, [extract_step], total_units=1)
+
+                async def report_extraction(done: int, total: int):
+                    progress_store.update(
+                        task_id,
+                        step=extract_step,
+                        step_status="completed" if done == total else "processing",
+                        advance=1,
+                        total=total
+                    )
+
+                content = await file_processor.process_file(temp_path, on_progress=report_extraction)
+                chapters_of_subject = await ai_processor.generact_list_of_subject(content)
+                await db_service.store_document(file_hash, content, chapters_of_subject)
         except Exception as e:
-            # Clean up temporary file
-            os.remove(temp_path)
             raise HTTPException(status_code=422, detail=f"Error processing file: {str(e)}")
 
         # Store task context in SQLite
         await db_service.store_task(
             task_id=task_id,
-            filename=file.filename,
+            filename=filename,
             chapters=[
                 {"title": chapter}
                 for chapter in chapters_of_subject
             ]
         )
 
+        # Keep the upload as a task artifact; identical uploads share one blob on disk
+        await artifact_store.adopt(task_id, temp_path, sha256=file_hash)
+        adopted = True
+
         # Store task context (could use Redis or another state management)
         return UploadResponse(
             task_id=task_id,
@@ -122,32 +206,217 @@ async def upload_file(
         # Catch any unexpected errors
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
     finally:
-        # Ensure file is closed
-        if 'file' in locals():
-            await file.close()
+        # Extraction progress is only kept while the upload runs; status then comes from the database
+        if extract_step is not None:
+            progress_store.forget(task_id)
 
-        # Remove temporary file if it exists
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            os.remove(temp_path)
+        # Release the task id and its directory unless the upload was kept as an artifact
+        if reserved and not adopted:
+            await db_service.discard_task(task_id)
+            await artifact_store.discard(task_id)
 
 
 @app.get("/api/seelab")
 async def see_lab():
     task_id = str(uuid.uuid4())
-    task_path  = f"./artifacts/{task_id}"
-    os.makedirs(task_path, exist_ok=True)
+    task_path = artifact_store.task_path(task_id)
 
-    image_url = await ai_processor.generate_image("test", task_path)
+    try:
+        image_url = await ai_processor.generate_image("test", "image_0.png", task_path)
+    except BaseException:
+        await artifact_store.discard(task_id)
+        raise
     return {"message": image_url}
 
 
+async def process_chapters_job(job, emit):
+    """Job handler: run the chapter pipeline and publish its progress"""
+    payload = job["payload"]
+    task_id = payload["task_id"]
+    start_chapter = payload["start_chapter"]
+
+    async def emit_progress(event):
+        progress_store.record_event(task_id, event)
+        await emit(event)
+
+    await db_service.update_task_status(task_id, "processing")
+    progress_store.update(task_id, status="processing")
+    try:
+        # Retrieve stored file and chapters
+        chapters = await db_service.get_chapters(task_id)
+        if not chapters:
+            raise PermanentJobError(f"No chapters found for task {task_id}")
+
+        # Process selected chapters
+        selected_chapters = chapters[start_chapter:payload["end_chapter"]+1]
+
+        progress_store.start(
+            task_id,
+            [f"Chapter {start_chapter + idx + 1}: {chapter.get('title')}" for idx, chapter in enumerate(selected_chapters)],
+            total_units=len(selected_chapters) * len(pipeline_scheduler.build_pipeline().stages)
+        )
+        results = await pipeline_scheduler.run(
+            task_id,
+            selected_chapters,
+            payload["content_type"],
+            on_event=emit_progress,
+            chapter_offset=start_chapter
+        )
+
+        # Failed chapters resume from their checkpoints when the job is retried
+        failed = [result for result in results if "error" in result]
+        if failed:
+            raise RuntimeError(f"{len(failed)} of {len(results)} chapters failed")
+    except Exception as e:
+        # The queue re-runs the job until its attempts are used up
+        retrying = job["attempt"] < job["max_attempts"] and not isinstance(e, PermanentJobError)
+        await db_service.update_task_status(task_id, "retrying" if retrying else "failed")
+        progress_store.update(task_id, status="retrying" if retrying else "failed", message=str(e))
+        raise
+
+    await db_service.update_task_status(task_id, "completed")
+
+    # Final completion message
+    await emit_progress({
+        "status": "completed",
+        "message": "All chapters processed successfully"
+    })
+
+
+async def task_snapshot(task_id: str):
+    """Progress from memory, re-synced from the database for tasks running in another process"""
+    if progress_store.needs_refresh(task_id):
+        status = await db_service.get_task_status(task_id)
+        if status is not None:
+            progress_store.seed(task_id, status)
+    snapshot = progress_store.get(task_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return snapshot
+
+
+async def wait_for_change(task_id: str, version: int, timeout: float):
+    """Wait for a new snapshot, polling the database in between for tasks run elsewhere"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            return None
+        changed = await progress_store.wait(task_id, version, min(remaining, settings.PROGRESS_REFRESH_SECONDS))
+        if changed is None:
+            changed = await task_snapshot(task_id)
+        if changed["version"] != version:
+            return changed
+
+
+@app.get("/api/status/{task_id}")
+async def get_status(task_id: str, request: Request, wait: float = 0):
+    """Task progress with ETags; with `wait`, a matching If-None-Match long-polls for a change"""
+    snapshot = await task_snapshot(task_id)
+    etag = progress_store.etag(snapshot)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if_none_match = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag in if_none_match:
+        changed = None
+        if wait > 0:
+            changed = await wait_for_change(
+                task_id,
+                snapshot["version"],
+                min(wait, settings.STATUS_LONG_POLL_MAX_SECONDS)
+            )
+        if changed is None:
+            return Response(status_code=304, headers=headers)
+        snapshot = changed
+        headers["ETag"] = progress_store.etag(snapshot)
+
+    return JSONResponse(snapshot, headers=headers)
+
+
+@app.get("/api/status/{task_id}/events")
+async def stream_status(task_id: str, request: Request):
+    """Server-Sent Events stream of task progress, resumable with Last-Event-ID"""
+    await task_snapshot(task_id)
+
+    # Event ids are the ETag without quotes; resume only within this process's epoch
+    version = 0
+    epoch, _, last_version = request.headers.get("last-event-id", "").partition("-")
+    if epoch == progress_store.epoch and last_version.isdigit():
+        version = int(last_version)
+
+    async def events():
+        # Heartbeats double as database re-syncs for tasks running in another process
+        heartbeat = min(settings.STATUS_SSE_HEARTBEAT_SECONDS, settings.PROGRESS_REFRESH_SECONDS)
+        async for snapshot in progress_store.watch(task_id, version, heartbeat):
+            if snapshot is None:
+                await task_snapshot(task_id)
+                yield ": keep-alive\n\n"
+                continue
+            event_id = progress_store.etag(snapshot).strip('"')
+            yield f"id: {event_id}\nevent: status\ndata: {json.dumps(snapshot)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return {"llm": llm_cache.stats(), "images": image_cache.stats(), "audio": audio_cache.stats()}
+
+
+@app.api_route("/api/videos/{task_id}/{chapter_index}", methods=["GET", "HEAD"])
+async def get_video(task_id: str, chapter_index: int):
+    """Stream a rendered chapter; supports Range requests for seeking"""
+    chapter = await db_service.get_processed_chapter(task_id, chapter_index)
+    if not chapter or not chapter.get("video_path") or not os.path.exists(chapter["video_path"]):
+        raise HTTPException(status_code=404, detail="Video not found")
+    await artifact_store.touch(task_id)
+    return video_response(chapter["video_path"], f"{task_id}_{chapter_index}.mp4")
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics; queue depths and cache counters are sampled per scrape"""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+
+    metrics_service.queue_depth.set(render_pool.queue_depth, "render")
+    metrics_service.queue_depth.set(db_service.pending_writes, "db_writes")
+    job_counts = await job_queue.counts()
+    for status in ("queued", "running", "completed", "failed"):
+        metrics_service.jobs.set(job_counts.get(status, 0), status)
+    for name, cache in (("llm", llm_cache), ("images", image_cache), ("audio", audio_cache)):
+        stats = cache.stats()
+        metrics_service.cache_hits.set(stats["hits"], name)
+        metrics_service.cache_misses.set(stats["misses"], name)
+        metrics_service.cache_hit_ratio.set(stats["hit_rate"], name)
+    for provider, limiter in rate_limiters.items():
+        stats = limiter.stats()
+        metrics_service.rate_limit_rate.set(stats["rate"], provider)
+        metrics_service.rate_limit_throttled.set(stats["throttled"], provider)
+
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 @app.websocket("/ws/process")
 async def websocket_processing(
     websocket: WebSocket,
     task_id: str,
     content_type: str = "KeyMoment",
     start_chapter: int = 0,
-    end_chapter: int = 3
+    end_chapter: int = 3,
+    job_id: Optional[str] = None
 ):
     # Validate input parameters
     if not task_id:
@@ -156,81 +425,32 @@ async def websocket_processing(
 
     await websocket.accept()
     try:
-
-        # Retrieve stored file and chapters
-        chapters = await db_service.get_chapters(task_id)
-
-        print(chapters)
-
-        # Process selected chapters
-        selected_chapters = chapters[start_chapter:end_chapter+1]
-
-        print(selected_chapters)
-        for idx, chapter in enumerate(selected_chapters):
-            # Update progress
-            await websocket.send_json({
-                "status": "processing",
-                "chapter": idx + 1,
-                "total_chapters": len(selected_chapters)
-            })
-
-            # Generate script based on content type
-            script = await ai_processor.generate_script(
-                chapter,
-                content_type=content_type
+        # Processing runs in the job queue; a dropped connection can
+        # reconnect with job_id to resume watching
+        if not job_id:
+            job_id = await job_queue.enqueue(
+                "process_chapters",
+                {
+                    "task_id": task_id,
+                    "content_type": content_type,
+                    "start_chapter": start_chapter,
+                    "end_chapter": end_chapter,
+                },
+                task_id=task_id
             )
 
-            # Generate voiceover
-            audio_path = await ai_processor.generate_voiceover(script)
-
-            # Generate subtitles
-            subtitles = await ai_processor.generate_subtitles(audio_path)
-
-            # format srt to python dict of subtitles
-            srt_dict = await ai_processor.format_srt_to_dict(subtitles)
-            await export_subjects_to_image_prompts(srt_dict)
-
-            # Generate image/visual
-            image_prompts = []
-            for filepath in glob.glob(os.path.join(task_path, "image_prompt_*.txt")):
-                with open(filepath, "r") as f:
-                    image_prompts.append(f.read())
-
-            # Generate image for each prompt
-            for idx, prompt in enumerate(image_prompts):
-                image_path = await ai_processor.generate_image(prompt, f"image_{idx}.png", task_path)
-
-            # Merge into video
-            video_path = await video_processor.create_video(
-                script,
-                audio_path,
-                subtitles,
-                image_path
-            )
-
-            # Send video path
-            await websocket.send_json({
-                "status": "chapter_complete",
-                "video_path": video_path,
-                "chapter_title": chapter.title
-            })
-
-            # Optional: small delay between chapters
-            await asyncio.sleep(1)
-
-        # Final completion message
-        await websocket.send_json({
-            "status": "completed",
-            "message": "All chapters processed successfully"
-        })
+        async for event in job_queue.subscribe(job_id):
+            await websocket.send_json(event)
 
+    except WebSocketDisconnect:
+        log_event("job.unsubscribed", job_id=job_id)
+        return
     except Exception as e:
         await websocket.send_json({
             "status": "error",
             "message": str(e)
         })
-    finally:
-        await websocket.close()
+    await websocket.close()
 
 # Helper function to retrieve task context (would be more robust with actual state management)
 async def get_chapters_for_task(task_id: str):
@@ -239,14 +459,12 @@ async def get_chapters_for_task(task_id: str):
     # You'd want to implement proper task/state management
     pass
 
-async def export_subjects_to_image_prompts(subjects: List[str], output_dir: str = "./artifacts/sample") -> None:
-    """Export each subject to an image prompt file in the specified directory"""
-    for idx, subject in enumerate(subjects):
-        image_prompt = await ai_processor.prepare_image_prompt(subject)
-        print(image_prompt)
-        filename = f"{output_dir}/image_prompt_{idx}.txt"
-        if not os.path.exists(filename):
-            with open(filename, "w") as f:
-                f.write(image_prompt)
-        print(image_prompt)
-        await asyncio.sleep(3)
+async def export_subjects_to_image_prompts(subjects: List[str], task_id: str) -> None:
+    """Export each subject to an image prompt file in the task's directory"""
+    # Prompts are prepared concurrently; the Mistral rate limiter paces the calls
+    image_prompts = await asyncio.gather(*(
+        ai_processor.prepare_image_prompt(subject) for subject in subjects
+    ))
+    task_path = artifact_store.task_path(task_id)
+    for idx, image_prompt in enumerate(image_prompts):
+        await artifact_store.write_text(task_id, os.path.join(task_path, f"image_prompt_{idx}.txt"), image_prompt)
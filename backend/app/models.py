@@ -1,6 +1,6 @@
 # backend/app/models.py
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, NamedTuple, Optional
 
 class Chapter(BaseModel):
     title: str
@@ -15,4 +15,15 @@ class ProcessingResult(BaseModel):
     chapter: Chapter
     script: VideoScript
     audio_url: Optional[str]
-    subtitles: Optional[str]
\ No newline at end of file
+    subtitles: Optional[str]
+
+class Cue(NamedTuple):
+    start_ms: int
+    end_ms: int
+    text: str
+
+class Voiceover(NamedTuple):
+    path: str
+    duration_ms: int
+    # Word timings from the TTS provider, when it returned them
+    alignment: Optional[List[Cue]] = None
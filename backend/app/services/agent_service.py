@@ -0,0 +1,70 @@
+from typing import Any, Dict, List, NamedTuple
+
+from pydantic_ai import Agent
+from pydantic_ai.models import Model
+
+_SHORT_VIDEO_SCRIPT = """
+enrich the content and create a short script for a Short Video to explain the subject in a fun way.
+The complete vocal script must not have more than 300 words. Always include a date. Additionally, include important people or events.
+Keep the content in French.
+
+The output must be a simple text containing the paragraphs, without sections.
+For this historical subject:"""
+
+
+class AgentSpec(NamedTuple):
+    system_prompt: str
+    result_type: Any = str
+
+
+# Prompt templates, keyed by content type (plus the non-script agents)
+AGENT_SPECS: Dict[str, AgentSpec] = {
+    "VS": AgentSpec("Generate a list of subjects from the given content."),
+    "KeyMoment": AgentSpec(_SHORT_VIDEO_SCRIPT),
+    "KeyCharacter": AgentSpec("""
+create a short script for a Short Video presenting the main historical figure of the subject in a fun way.
+The complete vocal script must not have more than 300 words. Include their dates and what they are remembered for.
+Keep the content in French.
+
+The output must be a simple text containing the paragraphs, without sections.
+For this historical subject:"""),
+    "Quiz": AgentSpec("""
+create a short script for a Short Video quizzing the viewer on the subject in a fun way.
+Ask 3 questions, each followed by a short pause and its answer. The complete vocal script must not have more than 300 words.
+Keep the content in French.
+
+The output must be a simple text containing the paragraphs, without sections.
+For this historical subject:"""),
+    "default": AgentSpec(_SHORT_VIDEO_SCRIPT),
+    "subjects": AgentSpec("""
+Generate a list of key subjects from the given content, give enough info about the subject and don't repeat key subjects.
+Every subject has to be unique in the list.
+The subject needs to have at least 2 words and should be understandable.
+If we need to generate a short video about it.
+Give just the list of subjects.""", List[str]),
+    "merge_subjects": AgentSpec("""
+The following subjects were extracted from consecutive parts of the same document.
+Merge the subjects that refer to the same thing, keeping the clearest wording, and keep the document order.
+Every subject has to be unique in the list.
+Give just the list of subjects.""", List[str]),
+}
+
+
+class AgentRegistry:
+    """Long-lived pydantic-ai agents, built once and shared by every call"""
+
+    def __init__(self, model: Model, specs: Dict[str, AgentSpec] = None):
+        self.model = model
+        self.specs = specs or AGENT_SPECS
+        self._agents = {
+            name: Agent(model, result_type=spec.result_type, system_prompt=spec.system_prompt)
+            for name, spec in self.specs.items()
+        }
+
+    def get(self, name: str) -> Agent:
+        """Agent for a content type, falling back to the default script agent"""
+        return self._agents.get(name) or self._agents["default"]
+
+    def system_prompt(self, name: str) -> str:
+        spec = self.specs.get(name) or self.specs["default"]
+        return spec.system_prompt
@@ -1,163 +1,306 @@
-from pydantic_ai import Agent
-from pydantic_ai.models.mistral import MistralModel
-from pydantic_ai.providers.mistral import MistralProvider
-from mistralai import Mistral
-from elevenlabs import ElevenLabs, save
-import httpx
-import requests
+import asyncio
+import base64
 import os
+import re
+import unicodedata
 import uuid
-from typing import Any, Dict, List
-from ..models import Chapter
+from typing import Any, Dict, List, Union
+from ..models import Chapter, Cue, Voiceover
 from ..config import settings
-from .file_service import FileProcessor
+from .file_service import FileProcessor, estimate_tokens
+from .asset_cache_service import audio_cache, image_cache
+from .cache_service import llm_cache
+from .http_service import http_pool
+from .metrics_service import log_event, traced
+from .rate_limit_service import rate_limiters
+from .subtitle_service import cues_from_alignment, merge_sentences, parse_subtitles
 
 file_processor = FileProcessor()
 
+
+def mp3_duration_ms(size: int, output_format: str) -> int:
+    """Duration of a constant-bitrate mp3 from its byte size (formats look like mp3_44100_128)"""
+    bitrate_kbps = int(output_format.rsplit("_", 1)[-1])
+    return size * 8 // bitrate_kbps
+
+
+def _subject_key(subject: str) -> str:
+    # Case, accents, punctuation and spacing do not make a subject different
+    text = unicodedata.normalize("NFKD", subject.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+def dedupe_subjects(subjects: List[str]) -> List[str]:
+    """Drop repeated subjects, keeping the first wording and the original order"""
+    seen = set()
+    unique = []
+    for subject in subjects:
+        subject = subject.strip()
+        key = _subject_key(subject)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(subject)
+    return unique
+
+
+def normalize_speech_text(text: str) -> str:
+    # Spacing and Unicode forms do not change what the voice says
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
 class AIProcessor:
-    def __init__(self):
-        self.mistral_model = MistralModel(
-            "mistral-small-latest",
-            provider=MistralProvider(api_key=settings.MISTRAL_API_KEY)
-        )
-        self.agent = Agent(self.mistral_model)
-        self.mistral_client = Mistral(api_key=settings.MISTRAL_API_KEY)
+    """Provider clients and their SDKs are only imported and built on first use"""
 
-        self.elevenlabs_client =  ElevenLabs(api_key=settings.ELEVEN_API_KEY)
+    def __init__(self):
+        self.mistral_model_name = "mistral-small-latest"
         self.elevenlabs_voice_id = settings.ELEVEN_VOICE_ID
         self.elevenlabs_model = "eleven_multilingual_v2"
+        self.seelab_style_id = settings.SEELAB_STYLE_ID
+
+        self._mistral_client = None
+        self._mistral_model = None
+        self._agents = None
+        self._elevenlabs_client = None
+
+    @property
+    def mistral_client(self):
+        # One Mistral client, on the shared connection pool, for agents and pydantic-ai
+        if self._mistral_client is None:
+            from mistralai import Mistral
+
+            self._mistral_client = Mistral(
+                api_key=settings.require("MISTRAL_API_KEY"),
+                server_url=settings.MISTRAL_BASE_URL,
+                async_client=http_pool.client("mistral")
+            )
+        return self._mistral_client
+
+    @property
+    def mistral_model(self):
+        if self._mistral_model is None:
+            from pydantic_ai.models.mistral import MistralModel
+            from pydantic_ai.providers.mistral import MistralProvider
+
+            self._mistral_model = MistralModel(
+                self.mistral_model_name,
+                provider=MistralProvider(mistral_client=self.mistral_client)
+            )
+        return self._mistral_model
+
+    @property
+    def agents(self):
+        if self._agents is None:
+            from .agent_service import AgentRegistry
 
-        self.gladia_api_key = settings.GLADIA_API_KEY
-        self.gladia_base_url = "https://api.gladia.io/v2/"
+            self._agents = AgentRegistry(self.mistral_model)
+        return self._agents
 
-        self.seelab_api_key = settings.SEELAB_API_KEY
-        self.seelab_style_id = 1003 # Flux HD
+    @property
+    def elevenlabs_client(self):
+        if self._elevenlabs_client is None:
+            from elevenlabs import AsyncElevenLabs
+            from elevenlabs.environment import ElevenLabsEnvironment
 
+            self._elevenlabs_client = AsyncElevenLabs(
+                api_key=settings.require("ELEVEN_API_KEY"),
+                environment=ElevenLabsEnvironment(
+                    base=settings.ELEVEN_BASE_URL,
+                    wss=settings.ELEVEN_BASE_URL.replace("http", "ws", 1)
+                ),
+                httpx_client=http_pool.client("elevenlabs")
+            )
+        return self._elevenlabs_client
+
+    @property
+    def gladia_api_key(self) -> str:
+        return settings.require("GLADIA_API_KEY")
+
+    @property
+    def seelab_api_key(self) -> str:
+        return settings.require("SEELAB_API_KEY")
+
+    def warm_up(self):
+        """Import the provider SDKs and build every client and agent now"""
+        self.agents
+        self.elevenlabs_client
+
+    @traced("ai.generate_script")
     async def generate_script(
         self,
         chapter: Chapter,
         content_type: str
     ) -> str:
         """Generate script based on content type"""
-        prompt_templates = {
-            "VS": self._generate_vs_script,
-            "KeyMoment": self._generate_key_moment_script,
-            "KeyCharacter": self._generate_character_script,
-            "Quiz": self._generate_quiz_script
+        return await self._run_agent(content_type, chapter)
+
+    async def _run_agent(self, name: str, content: Any) -> Any:
+        """Run a prebuilt Mistral agent, serving identical requests from the LLM cache"""
+        key = llm_cache.make_key(self.mistral_model_name, self.agents.system_prompt(name), None, content)
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            return cached
+
+        result = await rate_limiters["mistral"].call(self.agents.get(name).run, content)
+        await llm_cache.set(key, self.mistral_model_name, result.data)
+        return result.data
+
+    @traced("ai.generate_voiceover")
+    async def generate_voiceover(self, text: str, output_dir: str) -> Voiceover:
+        """Voice over for a script, from the audio cache or streamed from Eleven Labs"""
+        os.makedirs(output_dir, exist_ok=True)
+        text = normalize_speech_text(text)
+        output_format = settings.ELEVEN_OUTPUT_FORMAT
+        key = audio_cache.make_key(text, self.elevenlabs_voice_id, self.elevenlabs_model, output_format)
+
+        async def _create(audio_path: str) -> Dict[str, Any]:
+            # Stream to a temporary name; the final path only ever holds complete audio
+            partial_path = f"{audio_path}.partial"
+            try:
+                size, alignment = await self._synthesize(text, partial_path, output_format)
+                os.replace(partial_path, audio_path)
+            finally:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+            return {"duration_ms": mp3_duration_ms(size, output_format), "alignment": alignment}
+
+        audio_path = os.path.join(output_dir, f"audio_{uuid.uuid4()}.mp3")
+        metadata = await audio_cache.get_or_create(key, audio_path, _create)
+        alignment = [Cue(*cue) for cue in metadata["alignment"] or []]
+        return Voiceover(audio_path, metadata["duration_ms"], alignment or None)
+
+    async def _synthesize(self, text: str, audio_path: str, output_format: str):
+        """Stream speech to `audio_path`, returning its size and word timings"""
+        async def _stream():
+            size = 0
+            characters, starts, ends = [], [], []
+            audio_file = await asyncio.to_thread(open, audio_path, "wb")
+            try:
+                async for chunk in self.elevenlabs_client.text_to_speech.stream_with_timestamps(
+                    text=text,
+                    voice_id=self.elevenlabs_voice_id,
+                    model_id=self.elevenlabs_model,
+                    output_format=output_format
+                ):
+                    if chunk.audio_base_64:
+                        audio = base64.b64decode(chunk.audio_base_64)
+                        size += len(audio)
+                        await asyncio.to_thread(audio_file.write, audio)
+                    alignment = chunk.alignment
+                    if alignment and alignment.characters:
+                        # Chunks may be timed from their own start; keep the timeline monotonic
+                        offset = 0.0
+                        if ends and alignment.character_start_times_seconds[0] < ends[-1] - 0.001:
+                            offset = ends[-1]
+                        characters += alignment.characters
+                        starts += [t + offset for t in alignment.character_start_times_seconds]
+                        ends += [t + offset for t in alignment.character_end_times_seconds]
+            finally:
+                await asyncio.to_thread(audio_file.close)
+            return size, cues_from_alignment(characters, starts, ends)
+
+        return await rate_limiters["elevenlabs"].call(_stream)
+
+    @traced("ai.generate_subtitles")
+    async def generate_subtitles(self, audio_path: str) -> Dict[str, Any]:
+        """Transcribe audio with Gladia; only needed when the TTS gave no usable timing"""
+        client = http_pool.client("gladia")
+        headers = {
+            "X-Gladia-Key": self.gladia_api_key
         }
-        # Select appropriate prompt generator
-        generator = prompt_templates.get(content_type, self._generate_default_script)
 
-        return await generator(chapter)
+        # Upload the audio file
+        audio_bytes = await asyncio.to_thread(_read_bytes, audio_path)
+        files = {"audio": (os.path.basename(audio_path), audio_bytes, "audio/mpeg")}
+        response = await rate_limiters["gladia"].call(
+            http_pool.request, "gladia", "POST", "upload", headers=headers, files=files
+        )
+        audio_url = response.json()["audio_url"]
 
-    async def generate_voiceover(self, text: str) -> str:
-        """Generate voice over using Eleven Labs"""
-        audio = self.elevenlabs_client.text_to_speech.convert(
-            text=text,
-            voice_id=self.eleven_voice_id,
-            model_id=self.elevenlabs_model
+        # Request the transcription and wait for it to finish
+        response = await rate_limiters["gladia"].call(
+            http_pool.request,
+            "gladia",
+            "POST",
+            "pre-recorded",
+            headers=headers,
+            json={
+                "audio_url": audio_url,
+                "subtitles": True,
+                "subtitles_config": {"formats": ["srt"]}
+            }
         )
+        result_url = response.json()["result_url"]
 
-        # Save audio file and return path
-        audio_path = f"/videos/audio/audio_{uuid.uuid4()}.mp3"
-        save(audio, audio_path)
-        return audio_path
+        while True:
+            response = await client.get(result_url, headers=headers)
+            response.raise_for_status()
+            transcription = response.json()
+            if transcription["status"] == "done":
+                return transcription
+            if transcription["status"] == "error":
+                raise RuntimeError(f"Gladia transcription failed: {transcription.get('error_code')}")
+            await asyncio.sleep(settings.GLADIA_POLL_SECONDS)
 
-    async def generate_subtitles(self, audio_path: str) -> Dict[str, Any]:
-        """Generate subtitles using Gladia API via HTTP"""
-        async with httpx.AsyncClient() as client:
-            # Prepare the audio file for upload
-            with open(audio_path, "rb") as audio_file:
-                files = {"audio": ("audio.mp3", audio_file, "audio/mpeg")}
-                headers = {
-                    "X-API-Key": self.gladia_api_key
-                }
-
-                # Make the transcription request
-                response = await client.post(
-                    f"{self.gladia_base_url}transcription",
-                    headers=headers,
-                    files=files
-                )
-
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    # Handle error cases
-                    response.raise_for_status()
-
-    async def format_srt_to_dict(self, subtitles: str) -> Dict[str, Any]:
-        """Format subtitles from SRT format to a dictionary"""
-        agent=Agent(self.mistral_model, system_prompt= f"""
-Extract all the sentences from the given content.
-Ignore timecodes, index numbers, and formatting tags.
-Output only a Python list of strings, where each string is a sentence from the subtitles.
-Return only the list, no explanation or extra text.
-
-the content of the srt file:""")
-        default_scrypt = await agent.run(subtitles)
-        return default_scrypt.data
+    async def format_srt_to_dict(self, subtitles: Union[str, Dict[str, Any]]) -> List[str]:
+        """Extract the sentences from SRT/VTT text or a Gladia result"""
+        return [cue.text for cue in merge_sentences(parse_subtitles(subtitles))]
 
+    @traced("ai.prepare_image_prompt")
     async def prepare_image_prompt(self, subject: str) -> Dict[str, Any]:
-        print("preparing image prompt for subject:", subject)
         """Prepare image prompt for the given subject"""
-        chatResponse = await self.mistral_client.agents.complete_async(messages=[
+        key = llm_cache.make_key(None, None, settings.MISTRAL_AGENT_IMAGE_PROMPT, subject)
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            return cached
+
+        chatResponse = await rate_limiters["mistral"].call(self.mistral_client.agents.complete_async, messages=[
             {
                 "content": subject,
                 "role": "user",
             },
-        ], agent_id=settings.MISTRAL_AGENT_IMAGE_PROMPT)
-        return chatResponse.choices[0].message.content
-
-    async def _generate_vs_script(self, chapter):
-        # VS-specific script generation logic
-        agent=Agent(self.mistral_model, system_prompt="Generate a list of subjects from the given content.")
-        list_of_subject = await agent.run(chapter)
-        return list_of_subject
-
-    async def _generate_key_moment_script(self, chapter):
-        agent=Agent(self.mistral_model, system_prompt= f"""
-enrich the content and create a short script for a Short Video to explain the subject in a fun way.
-The complete vocal script must not have more than 300 words. Always include a date. Additionally, include important people or events.
-Keep the content in French.
-
-The output must be a simple text containing the paragraphs, without sections.
-For this historical subject:""")
-        default_scrypt = await agent.run(chapter)
-        return default_scrypt.data
-
-    async def _generate_character_script(self, chapter):
-        # Character focus script generation
-        pass
-
-    async def _generate_quiz_script(self, chapter):
-        # Quiz script generation
-        pass
-
-    async def _generate_default_script(self, chapter):
-        # Fallback script generation
-        agent=Agent(model=self.mistral_model, system_prompt= f"""
-enrich the content and create a short script for a Short Video to explain the subject in a fun way.
-The complete vocal script must not have more than 300 words. Always include a date. Additionally, include important people or events.
-Keep the content in French.
-
-The output must be a simple text containing the paragraphs, without sections.
-For this historical subject:""")
-        default_scrypt = await agent.run(chapter)
-        return default_scrypt
-
-    async def generate_image(self, script: str, filename: str, task_path: str) -> str:
-        """Generate image based on script and content type"""
+        ], agent_id=settings.require("MISTRAL_AGENT_IMAGE_PROMPT"))
+        image_prompt = chatResponse.choices[0].message.content
+        await llm_cache.set(key, settings.MISTRAL_AGENT_IMAGE_PROMPT, image_prompt)
+        return image_prompt
+
+    @traced("ai.generate_image")
+    async def generate_image(
+        self,
+        script: str,
+        filename: str,
+        task_path: str,
+        seed: int = None,
+        aspect_ratio: str = None
+    ) -> str:
+        """Generate an image, reusing the stored file when this exact request was made before"""
+        seed = settings.SEELAB_SEED if seed is None else seed
+        aspect_ratio = aspect_ratio or settings.SEELAB_ASPECT_RATIO
+        key = image_cache.make_key(script, self.seelab_style_id, seed, aspect_ratio)
+
+        async def _create(dest_path: str) -> Dict[str, Any]:
+            image_url = await self._request_image(script, seed, aspect_ratio)
+            await file_processor.download_image(image_url, os.path.basename(dest_path), os.path.dirname(dest_path))
+            return {"url": image_url}
+
+        metadata = await image_cache.get_or_create(key, os.path.join(task_path, filename), _create)
+        return metadata["url"]
+
+    async def _request_image(self, script: str, seed: int, aspect_ratio: str) -> str:
         # Use an image generation service like Seelab, DALL-E, Midjourney, etc.
-        url = "https://app.seelab.ai/api/predict/text-to-image"
         payload = {
             "async": False,
             "styleId": self.seelab_style_id,
             "params": {
                 "prompt": script,
                 "samples": "1",
-                "seed": 0,
-                "aspectRatio": "1:1"
+                "seed": seed,
+                "aspectRatio": aspect_ratio
             }
         }
         headers = {
@@ -165,24 +308,47 @@ For this historical subject:""")
             "content-type": "application/json",
             "Authorization": f"Token {self.seelab_api_key}"
         }
-        response = requests.post(url, json=payload, headers=headers)
+        response = await rate_limiters["seelab"].call(
+            http_pool.request,
+            "seelab",
+            "POST",
+            "predict/text-to-image",
+            json=payload,
+            headers=headers
+        )
         json_response = response.json()
-        image_url = json_response["result"]["image"][0]["url"]
-
-        await file_processor.download_image(image_url, filename, task_path)
+        return json_response["result"]["image"][0]["url"]
 
-        return image_url
 
-
-    async def generact_list_of_subject(self, content:str):
+    @traced("ai.generact_list_of_subject")
+    async def generact_list_of_subject(self, content:str) -> List[str]:
         """
         Generate a list of subjects from the given content using Mistral AI.
+        Large documents are chunked, mapped concurrently and merged.
         """
-        agent=Agent(self.mistral_model, result_type=List[str], system_prompt= f"""
-Generate a list of key subjects from the given content, give enough info about the subject and don't repeat key subjects.
-Every subject has to be unique in the list.
-The subject needs to have at least 2 words and should be understandable.
-If we need to generate a short video about it.
-Give just the list of subjects.""")
-        list_of_subject = await agent.run(content)
-        return list_of_subject.data
+        if estimate_tokens(content) <= settings.SUBJECT_CHUNK_TOKENS:
+            return dedupe_subjects(await self._run_agent("subjects", content))
+
+        chunks = await asyncio.to_thread(
+            file_processor.chunk_markdown, content, settings.SUBJECT_CHUNK_TOKENS
+        )
+        semaphore = asyncio.Semaphore(max(1, settings.SUBJECT_CONCURRENCY))
+
+        async def _extract(chunk: str) -> List[str]:
+            async with semaphore:
+                return await self._run_agent("subjects", chunk)
+
+        # Map: chunk results are cached individually, so edited documents reuse most of them
+        results = await asyncio.gather(*(_extract(chunk) for chunk in chunks))
+        subjects = dedupe_subjects([subject for result in results for subject in result])
+        log_event("subjects.extracted", subjects=len(subjects), chunks=len(chunks))
+
+        # Reduce: the candidate list is short, so one call can merge near-duplicates
+        if settings.SUBJECT_MERGE_WITH_LLM and len(subjects) > 1:
+            try:
+                merged = dedupe_subjects(await self._run_agent("merge_subjects", "\n".join(subjects)))
+                if merged:
+                    subjects = merged
+            except Exception as e:
+                log_event("subjects.merge_failed", error=str(e))
+        return subjects
@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from ..config import settings
+from .asset_cache_service import place_file
+from .db_service import DatabaseService, db_service
+
+
+def write_atomic(path: str, data: bytes):
+    """Write a file so readers only ever see the old or the complete new content"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """
+    Task files live under {root}/{task_id}/ as hardlinks to content-addressed
+    blobs; a per-task manifest records them, and a background GC keeps the
+    store under its disk quota by evicting least recently used tasks.
+    """
+
+    def __init__(self, root: str = None, max_bytes: int = None, db: DatabaseService = None):
+        self.root = root or settings.ARTIFACT_DIR
+        self.blob_root = os.path.join(self.root, "blobs")
+        self.max_bytes = max_bytes if max_bytes is not None else settings.ARTIFACT_MAX_BYTES
+        self.db = db or db_service
+        self._gc_task: Optional[asyncio.Task] = None
+        self.db.add_schema(self._create_tables)
+
+    def _create_tables(self):
+        try:
+            with sqlite3.connect(self.db.db_path) as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS artifact_blobs (
+                        blob_hash TEXT PRIMARY KEY,
+                        path TEXT,
+                        size INTEGER,
+                        created_at REAL
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS artifacts (
+                        task_id TEXT,
+                        name TEXT,
+                        blob_hash TEXT,
+                        created_at REAL,
+                        last_access REAL,
+                        PRIMARY KEY (task_id, name)
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_artifacts_blob ON artifacts(blob_hash)')
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error creating artifact tables: {e}")
+
+    def task_path(self, task_id: str, *parts: str) -> str:
+        """Directory owned by one task (created if needed); tasks never share paths"""
+        path = os.path.join(self.root, task_id, *parts)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    async def discard(self, task_id: str):
+        """Remove the directory of a task that recorded nothing"""
+        await asyncio.to_thread(shutil.rmtree, os.path.join(self.root, task_id), True)
+
+    def _blob_path(self, blob_hash: str) -> str:
+        return os.path.join(self.blob_root, blob_hash[:2], blob_hash)
+
+    async def adopt(self, task_id: str, path: str, sha256: str = None) -> str:
+        """Record a finished task file, deduplicating it against identical blobs"""
+        def _link():
+            blob_hash = sha256 or hash_file(path)
+            blob_path = self._blob_path(blob_hash)
+            if os.path.exists(blob_path):
+                # Same content already stored: share its inode
+                if not os.path.samefile(blob_path, path):
+                    place_file(blob_path, path)
+            else:
+                place_file(path, blob_path)
+            return blob_hash, blob_path, os.path.getsize(blob_path)
+
+        blob_hash, blob_path, size = await asyncio.to_thread(_link)
+        name = os.path.relpath(path, os.path.join(self.root, task_id))
+        now = time.time()
+        await self.db.write_many([
+            (
+                'INSERT OR IGNORE INTO artifact_blobs (blob_hash, path, size, created_at) VALUES (?, ?, ?, ?)',
+                (blob_hash, blob_path, size, now)
+            ),
+            (
+                'INSERT OR REPLACE INTO artifacts (task_id, name, blob_hash, created_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (task_id, name, blob_hash, now, now)
+            ),
+        ])
+        return path
+
+    async def write_text(self, task_id: str, path: str, text: str) -> str:
+        """Atomically write a text artifact into the task directory and record it"""
+        await asyncio.to_thread(write_atomic, path, text.encode("utf-8"))
+        return await self.adopt(task_id, path)
+
+    async def manifest(self, task_id: str) -> Dict[str, Dict[str, Any]]:
+        """Every recorded file of a task, by path relative to the task directory"""
+        def _sync_get(conn: sqlite3.Connection):
+            return conn.execute('''
+                SELECT a.name, a.blob_hash, b.size FROM artifacts a
+                JOIN artifact_blobs b ON b.blob_hash = a.blob_hash
+                WHERE a.task_id = ? ORDER BY a.name
+            ''', (task_id,)).fetchall()
+
+        rows = await self.db.read(_sync_get)
+        return {
+            name: {"path": os.path.join(self.root, task_id, name), "blob_hash": blob_hash, "size": size}
+            for name, blob_hash, size in rows
+        }
+
+    async def touch(self, task_id: str):
+        """Mark a task as recently used so the GC keeps it longer"""
+        await self.db.write('UPDATE artifacts SET last_access = ? WHERE task_id = ?', (time.time(), task_id))
+
+    async def collect_garbage(self) -> Dict[str, int]:
+        """
+        Delete unreferenced blobs and task directories nothing records, then
+        evict idle tasks (LRU) until under the quota
+        """
+        def _plan(conn: sqlite3.Connection):
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM artifact_blobs').fetchone()[0]
+            tasks = []
+            if self.max_bytes and total > self.max_bytes:
+                try:
+                    busy = {
+                        row[0] for row in conn.execute(
+                            "SELECT task_id FROM jobs WHERE status IN ('queued', 'running')"
+                        )
+                    }
+                except sqlite3.OperationalError:
+                    busy = set()
+                tasks = [
+                    task_id for task_id, _ in conn.execute(
+                        'SELECT task_id, MAX(last_access) FROM artifacts GROUP BY task_id ORDER BY 2'
+                    ).fetchall()
+                    if task_id not in busy
+                ]
+            return total, tasks
+
+        def _drop_unreferenced(conn: sqlite3.Connection) -> List[tuple]:
+            orphans = conn.execute('''
+                SELECT blob_hash, path, size FROM artifact_blobs
+                WHERE blob_hash NOT IN (SELECT blob_hash FROM artifacts)
+            ''').fetchall()
+            conn.executemany(
+                'DELETE FROM artifact_blobs WHERE blob_hash = ?',
+                [(blob_hash,) for blob_hash, _, _ in orphans]
+            )
+            return [(path, size) for _, path, size in orphans]
+
+        def _known_tasks(conn: sqlite3.Connection) -> set:
+            known = {row[0] for row in conn.execute('SELECT DISTINCT task_id FROM artifacts')}
+            try:
+                known.update(row[0] for row in conn.execute('SELECT task_id FROM tasks'))
+            except sqlite3.OperationalError:
+                pass
+            return known
+
+        def _unrecorded_dirs(known: set) -> List[str]:
+            # The grace period covers tasks created between the query and the scan
+            cutoff = time.time() - settings.ARTIFACT_ORPHAN_GRACE_SECONDS
+            paths = []
+            with os.scandir(self.root) as entries:
+                for entry in entries:
+                    if not entry.is_dir() or entry.name in known:
+                        continue
+                    try:
+                        uuid.UUID(entry.name)
+                    except ValueError:
+                        # blobs/ and fixtures such as sample/
+                        continue
+                    if entry.stat().st_mtime < cutoff:
+                        paths.append(entry.path)
+            return paths
+
+        def _remove(paths: List[str]):
+            for path in paths:
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+        total, tasks = await self.db.transaction(_plan)
+        freed = 0
+        evicted = 0
+
+        orphans = await self.db.transaction(_drop_unreferenced)
+        freed += sum(size for _, size in orphans)
+        await asyncio.to_thread(_remove, [path for path, _ in orphans])
+
+        known = await self.db.read(_known_tasks)
+        unrecorded = await asyncio.to_thread(_unrecorded_dirs, known)
+        await asyncio.to_thread(_remove, unrecorded)
+
+        for task_id in tasks:
+            if total - freed <= self.max_bytes:
+                break
+            await self.db.write('DELETE FROM artifacts WHERE task_id = ?', (task_id,))
+            orphans = await self.db.transaction(_drop_unreferenced)
+            freed += sum(size for _, size in orphans)
+            await asyncio.to_thread(_remove, [os.path.join(self.root, task_id)] + [path for path, _ in orphans])
+            evicted += 1
+            print(f"Evicted artifacts of task {task_id}")
+
+        return {
+            "total_bytes": total - freed,
+            "freed_bytes": freed,
+            "evicted_tasks": evicted,
+            "unrecorded_dirs": len(unrecorded),
+        }
+
+    def start(self):
+        """Run the garbage collector in the background"""
+        if self._gc_task is None or self._gc_task.done():
+            self._gc_task = asyncio.create_task(self._gc_loop())
+
+    async def stop(self):
+        if self._gc_task is not None:
+            self._gc_task.cancel()
+            await asyncio.gather(self._gc_task, return_exceptions=True)
+            self._gc_task = None
+
+    async def _gc_loop(self):
+        while True:
+            try:
+                await self.collect_garbage()
+            except Exception as e:
+                print(f"Artifact garbage collection failed: {e}")
+            await asyncio.sleep(settings.ARTIFACT_GC_INTERVAL_SECONDS)
+
+
+# Create a singleton instance
+artifact_store = ArtifactStore()
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from ..config import settings
+from .db_service import DatabaseService, db_service
+
+# Writes the asset to the given path and returns metadata to keep alongside it
+AssetCreator = Callable[[str], Awaitable[Dict[str, Any]]]
+
+
+def place_file(source: str, dest: str):
+    """Put `source` at `dest` atomically: a hardlink when possible, else a copy"""
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    tmp_path = f"{dest}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        # Different filesystem, or links unsupported; copyfile uses the
+        # kernel's in-place copy (sendfile) where available
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, dest)
+
+
+class AssetCache:
+    """Content-addressed files on disk, indexed in SQLite, evicted LRU under a byte quota"""
+
+    def __init__(
+        self,
+        namespace: str,
+        root: str,
+        max_bytes: int,
+        db: DatabaseService = None
+    ):
+        self.namespace = namespace
+        self.root = root
+        self.max_bytes = max_bytes
+        self.db = db or db_service
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.db.add_schema(self._create_table)
+
+    def _create_table(self):
+        try:
+            with sqlite3.connect(self.db.db_path) as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS asset_cache (
+                        namespace TEXT,
+                        cache_key TEXT,
+                        path TEXT,
+                        size INTEGER,
+                        metadata TEXT,
+                        created_at REAL,
+                        last_access REAL,
+                        PRIMARY KEY (namespace, cache_key)
+                    )
+                ''')
+                conn.execute(
+                    'CREATE INDEX IF NOT EXISTS idx_asset_cache_last_access '
+                    'ON asset_cache(namespace, last_access)'
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error creating asset_cache table: {e}")
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Hash everything that determines the generated asset"""
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _blob_path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.root, self.namespace, key[:2], f"{key}{suffix}")
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return {"path", "metadata"} for a cached asset, or None on a miss"""
+        def _sync_get(conn: sqlite3.Connection):
+            return conn.execute(
+                'SELECT path, metadata FROM asset_cache WHERE namespace = ? AND cache_key = ?',
+                (self.namespace, key)
+            ).fetchone()
+
+        try:
+            row = await self.db.read(_sync_get)
+        except sqlite3.Error as e:
+            print(f"Error reading {self.namespace} cache: {e}")
+            row = None
+
+        if row and not os.path.exists(row[0]):
+            # The blob was removed behind our back
+            await self.db.write(
+                'DELETE FROM asset_cache WHERE namespace = ? AND cache_key = ?',
+                (self.namespace, key)
+            )
+            row = None
+        if row is None:
+            return None
+
+        await self.db.write(
+            'UPDATE asset_cache SET last_access = ? WHERE namespace = ? AND cache_key = ?',
+            (time.time(), self.namespace, key)
+        )
+        return {"path": row[0], "metadata": json.loads(row[1] or "{}")}
+
+    async def put(self, key: str, source_path: str, metadata: Dict[str, Any] = None) -> str:
+        """Add a file to the cache (linked, not moved) and evict down to the quota"""
+        blob_path = self._blob_path(key, os.path.splitext(source_path)[1])
+        await asyncio.to_thread(place_file, source_path, blob_path)
+        size = os.path.getsize(blob_path)
+        now = time.time()
+        await self.db.write(
+            'INSERT OR REPLACE INTO asset_cache '
+            '(namespace, cache_key, path, size, metadata, created_at, last_access) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (self.namespace, key, blob_path, size, json.dumps(metadata or {}, ensure_ascii=False), now, now)
+        )
+        await self.evict()
+        return blob_path
+
+    async def get_or_create(self, key: str, dest_path: str, create: AssetCreator) -> Dict[str, Any]:
+        """
+        Place the asset for `key` at `dest_path`, creating it on a miss.
+        Concurrent requests for the same key share a single creation.
+        """
+        cached = await self.get(key)
+        if cached is None and key in self._inflight:
+            await asyncio.shield(self._inflight[key])
+            cached = await self.get(key)
+
+        if cached is not None:
+            self.hits += 1
+            await asyncio.to_thread(place_file, cached["path"], dest_path)
+            return cached["metadata"]
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            metadata = await create(dest_path)
+            await self.put(key, dest_path, metadata)
+            return metadata
+        finally:
+            del self._inflight[key]
+            future.set_result(None)
+
+    async def evict(self):
+        """Remove least recently used assets until the cache fits its quota"""
+        if not self.max_bytes:
+            return
+
+        def _select_victims(conn: sqlite3.Connection) -> List[str]:
+            total = conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM asset_cache WHERE namespace = ?',
+                (self.namespace,)
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return []
+            victims = []
+            for cache_key, path, size in conn.execute(
+                'SELECT cache_key, path, size FROM asset_cache WHERE namespace = ? ORDER BY last_access',
+                (self.namespace,)
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                victims.append((cache_key, path))
+                total -= size
+            conn.executemany(
+                'DELETE FROM asset_cache WHERE namespace = ? AND cache_key = ?',
+                [(self.namespace, cache_key) for cache_key, _ in victims]
+            )
+            return [path for _, path in victims]
+
+        try:
+            paths = await self.db.transaction(_select_victims)
+        except sqlite3.Error as e:
+            print(f"Error evicting {self.namespace} cache: {e}")
+            return
+
+        def _unlink():
+            # Hardlinks placed in task directories keep their data
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+        if paths:
+            self.evictions += len(paths)
+            await asyncio.to_thread(_unlink)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters since startup"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions
+        }
+
+
+# One cache per asset kind
+image_cache = AssetCache("images", settings.ASSET_CACHE_DIR, settings.IMAGE_CACHE_MAX_BYTES)
+audio_cache = AssetCache("audio", settings.ASSET_CACHE_DIR, settings.AUDIO_CACHE_MAX_BYTES)
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+
+from ..config import settings
+from .db_service import DatabaseService, db_service
+
+
+class LLMCache:
+    """Persistent, content-addressed cache of LLM responses stored in SQLite"""
+
+    def __init__(
+        self,
+        db: DatabaseService = None,
+        max_entries: int = None,
+        max_age_seconds: int = None
+    ):
+        self.db = db or db_service
+        self.max_entries = max_entries if max_entries is not None else settings.LLM_CACHE_MAX_ENTRIES
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else settings.LLM_CACHE_MAX_AGE_SECONDS
+        self.hits = 0
+        self.misses = 0
+        self.db.add_schema(self._create_table)
+
+    def _create_table(self):
+        try:
+            with sqlite3.connect(self.db.db_path) as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS llm_cache (
+                        cache_key TEXT PRIMARY KEY,
+                        model TEXT,
+                        response TEXT,
+                        created_at REAL,
+                        last_access REAL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_created_at ON llm_cache(created_at)')
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error creating llm_cache table: {e}")
+
+    @staticmethod
+    def make_key(model: str, system_prompt: Optional[str], agent_id: Optional[str], content: Any) -> str:
+        """Hash everything that can change the model output"""
+        payload = json.dumps(
+            [model, system_prompt, agent_id, content],
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Return the cached response, or None on a miss"""
+        def _sync_get(conn: sqlite3.Connection):
+            return conn.execute(
+                'SELECT response, created_at FROM llm_cache WHERE cache_key = ?',
+                (key,)
+            ).fetchone()
+
+        value = None
+        try:
+            row = await self.db.read(_sync_get)
+            if row and not (self.max_age_seconds and row[1] < time.time() - self.max_age_seconds):
+                value = json.loads(row[0])
+                await self.db.write(
+                    'UPDATE llm_cache SET last_access = ? WHERE cache_key = ?',
+                    (time.time(), key)
+                )
+        except (sqlite3.Error, json.JSONDecodeError) as e:
+            print(f"Error reading llm cache: {e}")
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, model: str, value: Any):
+        """Store a response and evict expired or least recently used entries"""
+        now = time.time()
+        try:
+            statements = [(
+                'INSERT OR REPLACE INTO llm_cache (cache_key, model, response, created_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, model, json.dumps(value, ensure_ascii=False), now, now)
+            )]
+            if self.max_age_seconds:
+                statements.append((
+                    'DELETE FROM llm_cache WHERE created_at < ?',
+                    (now - self.max_age_seconds,)
+                ))
+            if self.max_entries:
+                statements.append(('''
+                    DELETE FROM llm_cache WHERE cache_key IN (
+                        SELECT cache_key FROM llm_cache
+                        ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_entries,)))
+            await self.db.write_many(statements)
+        except (sqlite3.Error, TypeError) as e:
+            print(f"Error writing llm cache: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters since startup"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+# Create a singleton instance
+llm_cache = LLMCache()
@@ -2,26 +2,110 @@ import os
 import sqlite3
 import json
 import asyncio
-from typing import List, Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+from ..config import settings
+from .metrics_service import log_event, traced
+
+Statement = Tuple[str, tuple]
+
 
 class DatabaseService:
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, pool_size: int = None):
         # Use a more reliable way to set the database path
+        if db_path is None and settings.DB_PATH:
+            db_path = settings.DB_PATH
         if db_path is None:
             # Get the directory of the current script
             base_dir = os.path.dirname(os.path.abspath(__file__))
             # Go up one directory and then specify the database file
             db_path = os.path.join(base_dir, '..', '..', 'tasks.db')
-        
+
         self.db_path = db_path
-        self._create_tables()
+
+        # Readers share a small pool of threads, each holding one long-lived
+        # connection; all writes go through a single writer thread so they
+        # never contend for SQLite's write lock. Both are (re)created on first
+        # use, so the service keeps working after close()
+        self._pool_size = pool_size or settings.DB_POOL_SIZE
+        self._read_executor: Optional[ThreadPoolExecutor] = None
+        self._write_executor: Optional[ThreadPoolExecutor] = None
+        self._executors_lock = threading.Lock()
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        self._pending_writes: List[Tuple[str, tuple, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+        # Tables are created before the first query rather than at import
+        self._schema_hooks: List[Callable[[], None]] = [self._create_tables]
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            isolation_level=None,
+            check_same_thread=False,
+            timeout=30
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        conn.execute('PRAGMA foreign_keys=OFF')
+        return conn
+
+    def add_schema(self, create: Callable[[], None]):
+        """Register a table-creation callback, run once before the first query"""
+        with self._schema_lock:
+            if self._schema_ready:
+                create()
+            else:
+                self._schema_hooks.append(create)
+
+    def ensure_schema(self):
+        """Create every registered table now"""
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if not self._schema_ready:
+                for create in self._schema_hooks:
+                    create()
+                self._schema_ready = True
+
+    def _executors(self) -> Tuple[ThreadPoolExecutor, ThreadPoolExecutor]:
+        """Return the reader and writer pools, creating them on first use"""
+        with self._executors_lock:
+            if self._read_executor is None:
+                self._read_executor = ThreadPoolExecutor(
+                    max_workers=self._pool_size,
+                    thread_name_prefix="db-read"
+                )
+                self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+            return self._read_executor, self._write_executor
+
+    def _thread_connection(self) -> sqlite3.Connection:
+        """Return the long-lived connection owned by the current executor thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.ensure_schema()
+            conn = self._connect()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
 
     def _create_tables(self):
         """Create necessary tables if they don't exist"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            conn = self._connect()
+            try:
                 cursor = conn.cursor()
-                
+                cursor.execute('BEGIN')
+
                 # Tasks table to store upload and processing information
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS tasks (
@@ -32,7 +116,7 @@ class DatabaseService:
                         status TEXT DEFAULT 'pending'
                     )
                 ''')
-                
+
                 # Processed chapters table
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS processed_chapters (
@@ -42,102 +126,334 @@ class DatabaseService:
                         audio_path TEXT,
                         video_path TEXT,
                         status TEXT,
+                        PRIMARY KEY (task_id, chapter_index),
                         FOREIGN KEY(task_id) REFERENCES tasks(task_id)
                     )
                 ''')
-                
-                conn.commit()
+
+                # Older databases created processed_chapters without a key:
+                # drop duplicate rows, then enforce uniqueness with an index
+                cursor.execute('''
+                    DELETE FROM processed_chapters WHERE rowid NOT IN (
+                        SELECT MAX(rowid) FROM processed_chapters GROUP BY task_id, chapter_index
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_processed_chapters_key
+                    ON processed_chapters(task_id, chapter_index)
+                ''')
+
+                # Per-stage checkpoints for resumable chapter processing
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS chapter_stages (
+                        task_id TEXT,
+                        chapter_index INTEGER,
+                        content_type TEXT,
+                        stage TEXT,
+                        output TEXT,
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (task_id, chapter_index, content_type, stage)
+                    )
+                ''')
+
+                # Documents already extracted, keyed by content hash
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS documents (
+                        doc_hash TEXT PRIMARY KEY,
+                        markdown TEXT,
+                        chapters TEXT,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+
+                cursor.execute('COMMIT')
+            finally:
+                conn.close()
         except sqlite3.Error as e:
-            print(f"Error creating tables: {e}")
+            log_event("db.error", operation="create_tables", error=str(e))
+
+    @property
+    def pending_writes(self) -> int:
+        """Writes queued for the next batch"""
+        return len(self._pending_writes)
+
+    @traced("db.read")
+    async def read(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run `fn(conn)` on a pooled reader connection"""
+        def _sync_read():
+            return fn(self._thread_connection())
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executors()[0], _sync_read)
+
+    @traced("db.transaction")
+    async def transaction(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run `fn(conn)` inside an IMMEDIATE transaction on the writer connection"""
+        def _sync_transaction():
+            conn = self._thread_connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(conn)
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            return result
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executors()[1], _sync_transaction)
+
+    @traced("db.write")
+    async def write(self, sql: str, params: tuple = ()) -> None:
+        """Queue a write; concurrent writes are committed together in one transaction"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending_writes.append((sql, params, future))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_writes())
+        await future
+
+    @traced("db.write_many")
+    async def write_many(self, statements: List[Statement]) -> None:
+        """Apply several writes atomically"""
+        def _apply(conn: sqlite3.Connection):
+            for sql, params in statements:
+                conn.execute(sql, params)
+
+        await self.transaction(_apply)
+
+    async def _flush_writes(self):
+        while self._pending_writes:
+            # Let writes issued in the same loop iteration join this batch
+            await asyncio.sleep(0)
+            batch = self._pending_writes[:settings.DB_WRITE_BATCH_SIZE]
+            del self._pending_writes[:len(batch)]
+
+            def _apply(conn: sqlite3.Connection):
+                # A failing statement only rolls back itself, not the batch
+                errors = []
+                for sql, params, _future in batch:
+                    try:
+                        conn.execute(sql, params)
+                        errors.append(None)
+                    except sqlite3.Error as e:
+                        errors.append(e)
+                return errors
 
+            try:
+                errors = await self.transaction(_apply)
+            except Exception as e:
+                errors = [e] * len(batch)
+
+            for (_sql, _params, future), error in zip(batch, errors):
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    def close(self):
+        """Stop the executors and close every pooled connection; the next query starts new ones"""
+        with self._executors_lock:
+            executors = [self._read_executor, self._write_executor]
+            self._read_executor = None
+            self._write_executor = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._local = threading.local()
+
+    @traced("db.reserve_task")
+    async def reserve_task(self, task_id: str) -> bool:
+        """Claim a task id while its upload is processed; False when the id is taken"""
+        try:
+            await self.write("INSERT INTO tasks (task_id, status) VALUES (?, 'uploading')", (task_id,))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    @traced("db.discard_task")
+    async def discard_task(self, task_id: str):
+        """Release a reserved task id whose upload failed"""
+        try:
+            await self.write('DELETE FROM tasks WHERE task_id = ?', (task_id,))
+        except sqlite3.Error as e:
+            log_event("db.error", operation="discard_task", error=str(e))
+
+    @traced("db.store_task")
     async def store_task(self, task_id: str, filename: str, chapters: List[Dict[str, Any]]):
-        """Store task information"""
-        def _sync_store():
+        """Store task information, completing a reserved task"""
+        try:
+            await self.write(
+                'INSERT INTO tasks (task_id, original_filename, chapters) VALUES (?, ?, ?) '
+                'ON CONFLICT(task_id) DO UPDATE SET original_filename = excluded.original_filename, '
+                "chapters = excluded.chapters, status = 'pending'",
+                (task_id, filename, json.dumps(chapters))
+            )
+        except sqlite3.Error as e:
+            log_event("db.error", operation="store_task", error=str(e))
+
+    @traced("db.store_document")
+    async def store_document(self, doc_hash: str, markdown: str, chapters: List[str]):
+        """Store extracted content and subjects for a document hash"""
+        try:
+            await self.write(
+                'INSERT OR REPLACE INTO documents (doc_hash, markdown, chapters) VALUES (?, ?, ?)',
+                (doc_hash, markdown, json.dumps(chapters))
+            )
+        except sqlite3.Error as e:
+            log_event("db.error", operation="store_document", error=str(e))
+
+    @traced("db.get_document")
+    async def get_document(self, doc_hash: str) -> Optional[Dict[str, Any]]:
+        """Retrieve previously extracted content for a document hash"""
+        def _sync_get(conn: sqlite3.Connection):
             try:
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        'INSERT INTO tasks (task_id, original_filename, chapters) VALUES (?, ?, ?)',
-                        (task_id, filename, json.dumps(chapters))
-                    )
-                    conn.commit()
-            except sqlite3.Error as e:
-                print(f"Error storing task: {e}")
-        
-        return await asyncio.to_thread(_sync_store)
+                cursor = conn.execute(
+                    'SELECT markdown, chapters FROM documents WHERE doc_hash = ?',
+                    (doc_hash,)
+                )
+                result = cursor.fetchone()
+                if not result:
+                    return None
+                return {"markdown": result[0], "chapters": json.loads(result[1])}
+            except (sqlite3.Error, json.JSONDecodeError) as e:
+                log_event("db.error", operation="get_document", error=str(e))
+                return None
+
+        return await self.read(_sync_get)
 
+    @traced("db.get_task_status")
     async def get_task_status(self, task_id: str) -> str:
         """Retrieve task status"""
-        def _sync_get_status():
+        def _sync_get_status(conn: sqlite3.Connection):
             try:
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute('SELECT status FROM tasks WHERE task_id = ?', (task_id,))
-                    result = cursor.fetchone()
-                    return result[0] if result else None
+                cursor = conn.execute('SELECT status FROM tasks WHERE task_id = ?', (task_id,))
+                result = cursor.fetchone()
+                return result[0] if result else None
             except sqlite3.Error as e:
-                print(f"Error getting task status: {e}")
+                log_event("db.error", operation="get_task_status", error=str(e))
                 return None
-        
-        return await asyncio.to_thread(_sync_get_status)
 
+        return await self.read(_sync_get_status)
+
+    @traced("db.update_task_status")
+    async def update_task_status(self, task_id: str, status: str):
+        """Update task status"""
+        try:
+            await self.write('UPDATE tasks SET status = ? WHERE task_id = ?', (status, task_id))
+        except sqlite3.Error as e:
+            log_event("db.error", operation="update_task_status", error=str(e))
+
+    @traced("db.get_chapters")
     async def get_chapters(self, task_id: str) -> List[Dict[str, Any]]:
         """Retrieve chapters for a specific task"""
-        def _sync_get():
+        def _sync_get(conn: sqlite3.Connection):
             try:
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute('SELECT chapters FROM tasks WHERE task_id = ?', (task_id,))
-                    result = cursor.fetchone()
-                    return json.loads(result[0]) if result else []
+                cursor = conn.execute('SELECT chapters FROM tasks WHERE task_id = ?', (task_id,))
+                result = cursor.fetchone()
+                return json.loads(result[0]) if result else []
             except (sqlite3.Error, json.JSONDecodeError) as e:
-                print(f"Error retrieving chapters: {e}")
+                log_event("db.error", operation="get_chapters", error=str(e))
                 return []
-        
-        return await asyncio.to_thread(_sync_get)
 
+        return await self.read(_sync_get)
+
+    @traced("db.store_processed_chapter")
     async def store_processed_chapter(
-        self, 
-        task_id: str, 
-        chapter_index: int, 
-        script: str, 
-        audio_path: str, 
+        self,
+        task_id: str,
+        chapter_index: int,
+        script: str,
+        audio_path: str,
         video_path: str,
         status: str = 'completed'
     ):
         """Store processed chapter information"""
-        def _sync_store():
-            try:
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO processed_chapters 
-                        (task_id, chapter_index, script, audio_path, video_path, status) 
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (task_id, chapter_index, script, audio_path, video_path, status))
-                    conn.commit()
-            except sqlite3.Error as e:
-                print(f"Error storing processed chapter: {e}")
-        
-        return await asyncio.to_thread(_sync_store)
+        try:
+            await self.write('''
+                INSERT OR REPLACE INTO processed_chapters
+                (task_id, chapter_index, script, audio_path, video_path, status)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (task_id, chapter_index, script, audio_path, video_path, status))
+        except sqlite3.Error as e:
+            log_event("db.error", operation="store_processed_chapter", error=str(e))
 
+    @traced("db.get_processed_chapters")
     async def get_processed_chapters(self, task_id: str) -> List[Dict[str, Any]]:
         """Retrieve processed chapters for a task"""
-        def _sync_get():
+        def _sync_get(conn: sqlite3.Connection):
             try:
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        'SELECT * FROM processed_chapters WHERE task_id = ? ORDER BY chapter_index', 
-                        (task_id,)
-                    )
-                    columns = [column[0] for column in cursor.description]
-                    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+                cursor = conn.execute(
+                    'SELECT * FROM processed_chapters WHERE task_id = ? ORDER BY chapter_index',
+                    (task_id,)
+                )
+                columns = [column[0] for column in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
             except sqlite3.Error as e:
-                print(f"Error retrieving processed chapters: {e}")
+                log_event("db.error", operation="get_processed_chapters", error=str(e))
                 return []
-        
-        return await asyncio.to_thread(_sync_get)
+
+        return await self.read(_sync_get)
+
+    @traced("db.get_processed_chapter")
+    async def get_processed_chapter(self, task_id: str, chapter_index: int) -> Optional[Dict[str, Any]]:
+        """Retrieve one processed chapter"""
+        def _sync_get(conn: sqlite3.Connection):
+            try:
+                cursor = conn.execute(
+                    'SELECT * FROM processed_chapters WHERE task_id = ? AND chapter_index = ?',
+                    (task_id, chapter_index)
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                return dict(zip([column[0] for column in cursor.description], row))
+            except sqlite3.Error as e:
+                log_event("db.error", operation="get_processed_chapter", error=str(e))
+                return None
+
+        return await self.read(_sync_get)
+
+    @traced("db.store_stage_output")
+    async def store_stage_output(
+        self,
+        task_id: str,
+        chapter_index: int,
+        content_type: str,
+        stage: str,
+        output: Any
+    ):
+        """Checkpoint the output of one pipeline stage for a chapter"""
+        try:
+            await self.write('''
+                INSERT OR REPLACE INTO chapter_stages
+                (task_id, chapter_index, content_type, stage, output)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (task_id, chapter_index, content_type, stage, json.dumps(output)))
+        except (sqlite3.Error, TypeError) as e:
+            log_event("db.error", operation="store_stage_output", error=str(e))
+
+    @traced("db.get_stage_outputs")
+    async def get_stage_outputs(self, task_id: str, chapter_index: int, content_type: str) -> Dict[str, Any]:
+        """Retrieve checkpointed stage outputs for a chapter"""
+        def _sync_get(conn: sqlite3.Connection):
+            try:
+                cursor = conn.execute(
+                    'SELECT stage, output FROM chapter_stages WHERE task_id = ? AND chapter_index = ? AND content_type = ?',
+                    (task_id, chapter_index, content_type)
+                )
+                return {stage: json.loads(output) for stage, output in cursor.fetchall()}
+            except (sqlite3.Error, json.JSONDecodeError) as e:
+                log_event("db.error", operation="get_stage_outputs", error=str(e))
+                return {}
+
+        return await self.read(_sync_get)
 
 # Create a singleton instance
-db_service = DatabaseService()
\ No newline at end of file
+db_service = DatabaseService()
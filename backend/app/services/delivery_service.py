@@ -0,0 +1,53 @@
+import os
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from ..config import settings
+
+
+class SendfileResponse(FileResponse):
+    """
+    FileResponse that hands whole-file GETs to the server when it supports the
+    ASGI pathsend extension, so the body never passes through Python.
+    Range requests and other servers fall back to Starlette's streaming.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        pathsend = "http.response.pathsend" in scope.get("extensions", {})
+        if (
+            not pathsend
+            or scope["method"].upper() != "GET"
+            or "range" in Headers(scope=scope)
+        ):
+            await super().__call__(scope, receive, send)
+            return
+
+        if self.stat_result is None:
+            self.set_stat_headers(await anyio.to_thread.run_sync(os.stat, self.path))
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+        if self.background is not None:
+            await self.background()
+
+
+def video_response(path: str, filename: str) -> Response:
+    """Serve an MP4 with Range support, through nginx's sendfile when configured"""
+    if settings.VIDEO_ACCEL_REDIRECT_PREFIX:
+        relative_path = os.path.relpath(os.path.abspath(path), os.path.abspath(settings.ARTIFACT_DIR))
+        return Response(
+            media_type="video/mp4",
+            headers={"X-Accel-Redirect": settings.VIDEO_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + relative_path}
+        )
+    return SendfileResponse(
+        path,
+        media_type="video/mp4",
+        filename=filename,
+        content_disposition_type="inline"
+    )
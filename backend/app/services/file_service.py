@@ -1,54 +1,300 @@
 # backend/app/services/file_service.py
-import pymupdf4llm
-from typing import List
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from fastapi import HTTPException
+from python_multipart.multipart import MultipartParser, parse_options_header
+from ..config import settings
 from ..models import Chapter
-import requests
+from .artifact_service import write_atomic
+from .http_service import http_pool
+from .metrics_service import traced
 import re
 
+
+class FileTooLargeError(Exception):
+    """Raised when an upload exceeds the configured size limit"""
+    def __init__(self, max_size: int):
+        super().__init__(f"File too large. Maximum size is {max_size // (1024 * 1024)}MB")
+        self.max_size = max_size
+
+
+class InvalidUploadError(Exception):
+    """Raised when a multipart upload is malformed or has no file"""
+
+
+_extraction_pool: Optional[ProcessPoolExecutor] = None
+
+# Rough size of a token in characters for Latin-script text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, good enough to size prompts"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _get_extraction_pool() -> ProcessPoolExecutor:
+    global _extraction_pool
+    if _extraction_pool is None:
+        # Forking the running server would copy its threads and event loop into the workers
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _extraction_pool = ProcessPoolExecutor(
+            max_workers=settings.PDF_WORKERS or os.cpu_count(),
+            mp_context=multiprocessing.get_context(start_method)
+        )
+    return _extraction_pool
+
+
+def shutdown_extraction_pool():
+    """Stop the extraction worker processes"""
+    global _extraction_pool
+    if _extraction_pool is not None:
+        _extraction_pool.shutdown(cancel_futures=True)
+        _extraction_pool = None
+
+
+# The PDF libraries are heavy: import them on first use, mostly in the workers
+def _count_pages(file_path: str) -> int:
+    import pymupdf
+
+    with pymupdf.open(file_path) as doc:
+        return doc.page_count
+
+
+def _extract_pages(file_path: str, pages: Optional[List[int]] = None) -> str:
+    # Runs in a worker process
+    import pymupdf4llm
+
+    return pymupdf4llm.to_markdown(file_path, pages=pages)
+
+
 class FileProcessor:
     @staticmethod
-    async def process_file(file_path: str) -> str:
+    @traced("file.process_file")
+    async def process_file(
+        file_path: str,
+        on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+    ) -> str:
         """Extract content from PDF/DOC and convert to markdown"""
-        content = pymupdf4llm.to_markdown(file_path)
-        return content
+        loop = asyncio.get_running_loop()
+        pool = _get_extraction_pool()
+
+        try:
+            page_count = await asyncio.to_thread(_count_pages, file_path)
+        except Exception as e:
+            print(f"Could not count pages of {file_path}, extracting in one batch: {e}")
+            page_count = 0
+
+        batch_size = max(1, settings.PDF_BATCH_PAGES)
+        if page_count <= batch_size:
+            content = await loop.run_in_executor(pool, _extract_pages, file_path, None)
+            if on_progress:
+                await on_progress(1, 1)
+            return content
+
+        # Split into page ranges across workers and merge back in order
+        batches = [
+            list(range(start, min(start + batch_size, page_count)))
+            for start in range(0, page_count, batch_size)
+        ]
+        futures = [
+            loop.run_in_executor(pool, _extract_pages, file_path, pages)
+            for pages in batches
+        ]
+        try:
+            if on_progress:
+                done = 0
+                for future in asyncio.as_completed(futures):
+                    await future
+                    done += 1
+                    await on_progress(done, len(batches))
+
+            return "".join(await asyncio.gather(*futures))
+        except BaseException:
+            # Drop queued batches of a failed extraction and collect their outcomes
+            for future in futures:
+                future.cancel()
+            await asyncio.gather(*futures, return_exceptions=True)
+            raise
 
     @staticmethod
+    @traced("file.receive_upload")
+    async def receive_upload(
+        chunks: AsyncIterator[bytes],
+        content_type: str,
+        dest_dir: str,
+        max_size: int,
+        field_name: str = "file"
+    ) -> Tuple[str, int, str]:
+        """
+        Parse a multipart body as it arrives, streaming one file field into
+        dest_dir and hashing it in the same pass; returns (path, size, sha256).
+        The body is abandoned as soon as the file or the request exceeds max_size.
+        """
+        mime_type, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if mime_type != b"multipart/form-data" or not boundary:
+            raise InvalidUploadError("Expected a multipart/form-data body")
+
+        # Parser callbacks only record events; file I/O happens off the loop
+        headers: dict = {}
+        header = {"field": b"", "value": b""}
+        events: List[tuple] = []
+        state = {"in_file": False, "done": False}
+
+        def on_part_begin():
+            headers.clear()
+
+        def on_header_field(data, start, end):
+            header["field"] += data[start:end]
+
+        def on_header_value(data, start, end):
+            header["value"] += data[start:end]
+
+        def on_header_end():
+            headers[header["field"].lower()] = header["value"]
+            header["field"] = header["value"] = b""
+
+        def on_headers_finished():
+            _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+            state["in_file"] = not state["done"] and disposition.get(b"name") == field_name.encode()
+            if state["in_file"]:
+                filename = os.path.basename(disposition.get(b"filename", b"").decode("utf-8", "replace"))
+                if filename in ("", ".", ".."):
+                    raise InvalidUploadError("Upload has no valid file name")
+                events.append(("open", filename))
+
+        def on_part_data(data, start, end):
+            if state["in_file"]:
+                events.append(("data", data[start:end]))
+
+        def on_part_end():
+            if state["in_file"]:
+                state["in_file"] = False
+                state["done"] = True
+
+        parser = MultipartParser(boundary, {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        })
+
+        digest = hashlib.sha256()
+        max_body = max_size + settings.UPLOAD_MULTIPART_OVERHEAD_BYTES
+        received = size = 0
+        path = None
+        buffer = None
+        try:
+            async for chunk in chunks:
+                received += len(chunk)
+                if received > max_body:
+                    raise FileTooLargeError(max_size)
+                try:
+                    parser.write(chunk)
+                except InvalidUploadError:
+                    raise
+                except Exception as e:
+                    raise InvalidUploadError(f"Malformed multipart body: {e}")
+
+                for kind, value in events:
+                    if kind == "open":
+                        path = f"{dest_dir}/{value}"
+                        buffer = await asyncio.to_thread(open, path, "wb")
+                    else:
+                        size += len(value)
+                        if size > max_size:
+                            raise FileTooLargeError(max_size)
+                        digest.update(value)
+                        await asyncio.to_thread(buffer.write, value)
+                events.clear()
+
+            if not state["done"]:
+                raise InvalidUploadError(f"No '{field_name}' file in upload")
+            await asyncio.to_thread(buffer.close)
+            return path, size, digest.hexdigest()
+        except BaseException:
+            if buffer is not None:
+                buffer.close()
+                os.remove(path)
+            raise
+
+    @staticmethod
+    @traced("file.download_image")
     async def download_image(url: str, name: str, path: str):
         """Download image from url to path/name"""
-        response = requests.get(url)
+        response = await http_pool.client("downloads").get(url)
+        response.raise_for_status()
+
         try:
-            with open(f"{path}/{name}", "wb") as buffer:
-                buffer.write(response.content)
-                buffer.close()
+            await asyncio.to_thread(write_atomic, f"{path}/{name}", response.content)
         except IOError as e:
             raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
 
     @staticmethod
+    @traced("file.split_into_chapters")
     def split_into_chapters(markdown_content: str) -> List[Chapter]:
         """Split markdown content into chapters"""
         chapters = []
-        current_chapter = ""
+        current_lines: List[str] = []
         current_title = ""
 
-        # Split by markdown headers
-        lines = markdown_content.split('\n')
-        for line in lines:
+        # Split by markdown headers; lines are joined once per chapter
+        for line in markdown_content.split('\n'):
             if line.startswith('#'):
-                if current_chapter:
+                if current_lines:
                     chapters.append(Chapter(
                         title=current_title.strip(),
-                        content=current_chapter.strip()
+                        content="\n".join(current_lines).strip()
                     ))
                 current_title = line.lstrip('#').strip()
-                current_chapter = ""
+                current_lines = []
             else:
-                current_chapter += line + "\n"
+                current_lines.append(line)
 
         # Add the last chapter
-        if current_chapter:
+        if current_lines:
             chapters.append(Chapter(
                 title=current_title.strip(),
-                content=current_chapter.strip()
+                content="\n".join(current_lines).strip()
             ))
 
         return chapters
+
+    @staticmethod
+    @traced("file.chunk_markdown")
+    def chunk_markdown(markdown_content: str, max_tokens: int) -> List[str]:
+        """Pack consecutive chapters into chunks of at most `max_tokens` (estimated)"""
+        max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+        pieces: List[str] = []
+        for chapter in FileProcessor.split_into_chapters(markdown_content):
+            text = f"# {chapter.title}\n\n{chapter.content}" if chapter.title else chapter.content
+            if not text.strip():
+                continue
+            if len(text) <= max_chars:
+                pieces.append(text)
+                continue
+            # Oversized chapters are cut on paragraphs, and long paragraphs on length
+            for paragraph in text.split("\n\n"):
+                for start in range(0, len(paragraph), max_chars):
+                    pieces.append(paragraph[start:start + max_chars])
+
+        chunks: List[str] = []
+        current: List[str] = []
+        size = 0
+        for piece in pieces:
+            if current and size + len(piece) + 2 > max_chars:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece) + 2
+        if current:
+            chunks.append("\n\n".join(current))
+        return chunks
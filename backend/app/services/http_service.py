@@ -0,0 +1,69 @@
+import importlib.util
+from typing import Dict, Optional
+
+import httpx
+
+from ..config import settings
+
+# HTTP/2 needs the optional h2 package
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class HttpClientPool:
+    """One keep-alive httpx.AsyncClient per external provider, shared by every service"""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def provider_settings(self, provider: str) -> Dict[str, Optional[object]]:
+        """Base URL and read timeout for a provider; base URLs can point at local stubs"""
+        providers = {
+            "mistral": (settings.MISTRAL_BASE_URL, settings.MISTRAL_TIMEOUT_SECONDS),
+            "elevenlabs": (settings.ELEVEN_BASE_URL, settings.ELEVEN_TIMEOUT_SECONDS),
+            "gladia": (settings.GLADIA_BASE_URL, settings.GLADIA_TIMEOUT_SECONDS),
+            "seelab": (settings.SEELAB_BASE_URL, settings.SEELAB_TIMEOUT_SECONDS),
+            # Generated assets on provider CDNs, fetched by absolute URL
+            "downloads": (None, settings.HTTP_TIMEOUT_SECONDS),
+        }
+        if provider not in providers:
+            raise ValueError(f"Unknown provider: {provider}")
+        base_url, timeout = providers[provider]
+        return {"base_url": base_url, "timeout": timeout}
+
+    def client(self, provider: str) -> httpx.AsyncClient:
+        """Return the shared client for a provider, creating it on first use"""
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            config = self.provider_settings(provider)
+            kwargs = {}
+            if config["base_url"]:
+                kwargs["base_url"] = config["base_url"]
+            client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE and settings.HTTP2_ENABLED,
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+                    max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+                    keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS
+                ),
+                timeout=httpx.Timeout(config["timeout"], connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS),
+                follow_redirects=True,
+                **kwargs
+            )
+            self._clients[provider] = client
+        return client
+
+    async def request(self, provider: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request on the provider's client, raising on HTTP error statuses"""
+        response = await self.client(provider).request(method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def aclose(self):
+        """Close every pooled connection"""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients = {}
+
+
+# Create a singleton instance
+http_pool = HttpClientPool()
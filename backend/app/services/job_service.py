@@ -0,0 +1,334 @@
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from ..config import settings
+from .db_service import DatabaseService, db_service
+from .metrics_service import log_event, span
+
+JobHandler = Callable[[Dict[str, Any], Callable[[Dict[str, Any]], Awaitable[None]]], Awaitable[None]]
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class PermanentJobError(Exception):
+    """Raised by handlers for failures that another attempt cannot fix"""
+
+
+class JobQueue:
+    """Persistent job queue stored in SQLite, with heartbeats and retries"""
+
+    def __init__(self, db: DatabaseService = None):
+        self.db = db or db_service
+        self._handlers: Dict[str, JobHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._waiters: List[asyncio.Event] = []
+        self.db.add_schema(self._create_tables)
+
+    def _create_tables(self):
+        try:
+            with sqlite3.connect(self.db.db_path) as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        job_id TEXT PRIMARY KEY,
+                        task_id TEXT,
+                        kind TEXT,
+                        payload TEXT,
+                        status TEXT DEFAULT 'queued',
+                        attempts INTEGER DEFAULT 0,
+                        max_attempts INTEGER,
+                        worker_id TEXT,
+                        available_at REAL,
+                        heartbeat_at REAL,
+                        created_at REAL,
+                        updated_at REAL,
+                        error TEXT
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, available_at)')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS job_events (
+                        job_id TEXT,
+                        seq INTEGER,
+                        event TEXT,
+                        created_at REAL,
+                        PRIMARY KEY (job_id, seq)
+                    )
+                ''')
+                conn.commit()
+        except sqlite3.Error as e:
+            log_event("db.error", operation="create_job_tables", error=str(e))
+
+    def _notify(self):
+        for waiter in self._waiters:
+            waiter.set()
+
+    async def _wait_for_activity(self, timeout: float):
+        """Sleep until something is published in this process, or the timeout expires"""
+        waiter = asyncio.Event()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiters.remove(waiter)
+
+    def register(self, kind: str, handler: JobHandler):
+        """Register the coroutine that executes jobs of the given kind"""
+        self._handlers[kind] = handler
+
+    async def enqueue(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        task_id: str = None,
+        max_attempts: int = None
+    ) -> str:
+        """Add a job to the queue and return its id"""
+        job_id = str(uuid.uuid4())
+        max_attempts = max_attempts or settings.JOB_MAX_ATTEMPTS
+        now = time.time()
+
+        await self.db.write(
+            'INSERT INTO jobs (job_id, task_id, kind, payload, max_attempts, available_at, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, task_id, kind, json.dumps(payload), max_attempts, now, now, now)
+        )
+        await self.publish(job_id, {"status": "queued", "job_id": job_id})
+        return job_id
+
+    async def _fail_abandoned(self):
+        """Fail stale running jobs that have no attempts left, e.g. ones that keep killing their worker"""
+        def _sync_get(conn: sqlite3.Connection):
+            return conn.execute(
+                "SELECT job_id, task_id FROM jobs "
+                "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= max_attempts",
+                (time.time() - settings.JOB_STALE_SECONDS,)
+            ).fetchall()
+
+        for job_id, task_id in await self.db.read(_sync_get):
+            error = "Worker stopped responding on the last attempt"
+            log_event("job.failed", job_id=job_id, task_id=task_id, error=error)
+            # Publish before changing status so subscribers never miss the final event
+            await self.publish(job_id, {"status": "error", "message": error})
+            now = time.time()
+            await self.db.write(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? "
+                "WHERE job_id = ? AND status = 'running' AND heartbeat_at < ?",
+                (error, now, job_id, now - settings.JOB_STALE_SECONDS)
+            )
+            if task_id:
+                await self.db.update_task_status(task_id, "failed")
+
+    async def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically claim the next runnable job, including ones whose worker stopped heartbeating"""
+        await self._fail_abandoned()
+
+        def _sync_claim(conn: sqlite3.Connection):
+            now = time.time()
+            row = conn.execute('''
+                SELECT job_id, task_id, kind, payload, attempts, max_attempts FROM jobs
+                WHERE (status = 'queued' AND available_at <= ?)
+                   OR (status = 'running' AND heartbeat_at < ? AND attempts < max_attempts)
+                ORDER BY created_at LIMIT 1
+            ''', (now, now - settings.JOB_STALE_SECONDS)).fetchone()
+            if not row:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1, "
+                "heartbeat_at = ?, updated_at = ? WHERE job_id = ?",
+                (worker_id, now, now, row[0])
+            )
+            return {
+                "job_id": row[0],
+                "task_id": row[1],
+                "kind": row[2],
+                "payload": json.loads(row[3]),
+                "attempt": row[4] + 1,
+                "max_attempts": row[5],
+            }
+
+        try:
+            return await self.db.transaction(_sync_claim)
+        except sqlite3.Error as e:
+            log_event("job.claim_failed", worker_id=worker_id, error=str(e))
+            return None
+
+    async def heartbeat(self, job_id: str, worker_id: str):
+        """Mark a running job as still alive"""
+        now = time.time()
+        await self.db.write(
+            'UPDATE jobs SET heartbeat_at = ?, updated_at = ? WHERE job_id = ? AND worker_id = ?',
+            (now, now, job_id, worker_id)
+        )
+
+    async def complete(self, job_id: str):
+        await self.db.write(
+            "UPDATE jobs SET status = 'completed', error = NULL, updated_at = ? WHERE job_id = ?",
+            (time.time(), job_id)
+        )
+
+    async def fail(self, job_id: str, error: str, retry: bool = True) -> bool:
+        """Record a failure; returns True when the job was re-queued for another attempt"""
+        def _sync_fail(conn: sqlite3.Connection):
+            now = time.time()
+            row = conn.execute(
+                'SELECT attempts, max_attempts FROM jobs WHERE job_id = ?', (job_id,)
+            ).fetchone()
+            if retry and row and row[0] < row[1]:
+                # Exponential backoff before the next attempt
+                delay = settings.JOB_RETRY_BACKOFF_SECONDS * (2 ** (row[0] - 1))
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, available_at = ?, updated_at = ? WHERE job_id = ?",
+                    (error, now + delay, now, job_id)
+                )
+                return True
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE job_id = ?",
+                (error, now, job_id)
+            )
+            return False
+
+        return await self.db.transaction(_sync_fail)
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        def _sync_get(conn: sqlite3.Connection):
+            cursor = conn.execute(
+                'SELECT job_id, task_id, kind, status, attempts, max_attempts, error, created_at, updated_at '
+                'FROM jobs WHERE job_id = ?',
+                (job_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            columns = [column[0] for column in cursor.description]
+            return dict(zip(columns, row))
+
+        return await self.db.read(_sync_get)
+
+    async def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        def _sync_get(conn: sqlite3.Connection):
+            return dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+        return await self.db.read(_sync_get)
+
+    async def publish(self, job_id: str, event: Dict[str, Any]):
+        """Append a progress event to the job's event log"""
+        await self.db.write(
+            'INSERT INTO job_events (job_id, seq, event, created_at) '
+            'SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM job_events WHERE job_id = ?',
+            (job_id, json.dumps(event), time.time(), job_id)
+        )
+        self._notify()
+
+    async def _events_after(self, job_id: str, seq: int) -> List[tuple]:
+        def _sync_get(conn: sqlite3.Connection):
+            return conn.execute(
+                'SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq',
+                (job_id, seq)
+            ).fetchall()
+
+        return await self.db.read(_sync_get)
+
+    async def subscribe(self, job_id: str, after_seq: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the job's progress events, replaying history, until it finishes"""
+        last_seq = after_seq
+        while True:
+            for seq, event in await self._events_after(job_id, last_seq):
+                last_seq = seq
+                yield json.loads(event)
+
+            job = await self.get_job(job_id)
+            if job is None or job["status"] in TERMINAL_STATUSES:
+                # Drain anything published just before the status changed
+                for seq, event in await self._events_after(job_id, last_seq):
+                    last_seq = seq
+                    yield json.loads(event)
+                return
+
+            # Events from this process wake us up immediately; other processes are polled
+            await self._wait_for_activity(settings.JOB_POLL_SECONDS)
+
+    async def _execute(self, job: Dict[str, Any], worker_id: str):
+        job_id = job["job_id"]
+        handler = self._handlers.get(job["kind"])
+
+        async def emit(event: Dict[str, Any]):
+            await self.publish(job_id, event)
+
+        async def _beat():
+            while True:
+                await asyncio.sleep(settings.JOB_HEARTBEAT_SECONDS)
+                await self.heartbeat(job_id, worker_id)
+
+        heartbeat_task = asyncio.create_task(_beat())
+        try:
+            if handler is None:
+                raise PermanentJobError(f"No handler registered for job kind {job['kind']}")
+            with span(f"job.{job['kind']}", job_id=job_id, task_id=job.get("task_id"), attempt=job["attempt"]):
+                await handler(job, emit)
+        except asyncio.CancelledError:
+            # Leave the job running; another worker reclaims it once the heartbeat goes stale
+            raise
+        except Exception as e:
+            retry = not isinstance(e, PermanentJobError)
+            retrying = retry and job["attempt"] < job["max_attempts"]
+            log_event(
+                "job.failed",
+                job_id=job_id,
+                task_id=job.get("task_id"),
+                attempt=job["attempt"],
+                retrying=retrying,
+                error=str(e)
+            )
+            # Publish before changing status so subscribers never miss the final event
+            if retrying:
+                await emit({"status": "retrying", "attempt": job["attempt"], "message": str(e)})
+            else:
+                await emit({"status": "error", "message": str(e)})
+            await self.fail(job_id, str(e), retry=retry)
+        else:
+            await self.complete(job_id)
+        finally:
+            heartbeat_task.cancel()
+
+    async def _worker_loop(self, worker_id: str):
+        while True:
+            try:
+                job = await self.claim(worker_id)
+            except Exception as e:
+                log_event("job.claim_failed", worker_id=worker_id, error=str(e))
+                job = None
+
+            if job is None:
+                await self._wait_for_activity(settings.JOB_POLL_SECONDS)
+                continue
+
+            try:
+                await self._execute(job, worker_id)
+            except Exception as e:
+                # The job is reclaimed once its heartbeat goes stale; keep the worker alive
+                log_event("job.worker_error", worker_id=worker_id, job_id=job["job_id"], error=str(e))
+
+    def start(self, workers: int = None):
+        """Start worker coroutines on the running event loop"""
+        count = workers if workers is not None else settings.JOB_WORKERS
+        for _ in range(count):
+            worker_id = f"worker-{uuid.uuid4()}"
+            self._workers.append(asyncio.create_task(self._worker_loop(worker_id)))
+
+    async def stop(self):
+        """Cancel the workers; interrupted jobs are retried after they go stale"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+# Create a singleton instance
+job_queue = JobQueue()
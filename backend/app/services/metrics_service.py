@@ -0,0 +1,275 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import json
+import math
+import os
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from ..config import settings
+
+# Seconds; covers database calls up to long renders
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+_NO_SPAN = nullcontext()
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    """A counter or gauge, one value per label combination"""
+
+    def __init__(self, kind: str, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.kind = kind
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values: Any, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values: Any, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value: float, *label_values: Any):
+        """Set the value; counters are set when mirroring totals kept elsewhere"""
+        self._values[label_values] = value
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(Metric):
+    """Cumulative buckets, sum and count per label combination"""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = None):
+        super().__init__("histogram", name, help_text, labels)
+        self.buckets = tuple(buckets or DEFAULT_BUCKETS)
+        self._series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *label_values: Any):
+        # One slot per bucket, then +Inf, sum and count
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 3)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class Span(NamedTuple):
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class _ActiveSpan:
+    """Timing for one span; trace ids are only generated when spans are logged"""
+
+    __slots__ = ("registry", "name", "attributes", "span", "token", "start")
+
+    def __init__(self, registry: "MetricsRegistry", name: str, attributes: Dict[str, Any]):
+        self.registry = registry
+        self.name = name
+        self.attributes = attributes
+        self.span = None
+        self.token = None
+
+    def __enter__(self) -> Optional[Span]:
+        if settings.TRACE_LOG_SPANS:
+            parent = _current_span.get()
+            self.span = Span(
+                self.name,
+                parent.trace_id if parent else os.urandom(16).hex(),
+                os.urandom(8).hex(),
+                parent.span_id if parent else None
+            )
+            self.token = _current_span.set(self.span)
+        self.registry.span_in_flight.inc(self.name)
+        self.start = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        duration = time.perf_counter() - self.start
+        registry = self.registry
+        registry.span_in_flight.dec(self.name)
+        registry.span_seconds.observe(duration, self.name)
+        status = "ok"
+        if exc_type is not None:
+            status = "cancelled" if issubclass(exc_type, asyncio.CancelledError) else "error"
+            if status == "error":
+                registry.span_errors.inc(self.name)
+        if self.token is not None:
+            _current_span.reset(self.token)
+            print(json.dumps({
+                "span": self.name,
+                "trace_id": self.span.trace_id,
+                "span_id": self.span.span_id,
+                "parent_id": self.span.parent_id,
+                "duration_ms": round(duration * 1000, 3),
+                "status": status,
+                **self.attributes,
+            }, default=str))
+        return False
+
+
+class MetricsRegistry:
+    """Process-wide metrics in the Prometheus text format, plus span timing and loop lag"""
+
+    def __init__(self, enabled: bool = None):
+        self.enabled = settings.METRICS_ENABLED if enabled is None else enabled
+        self._metrics: Dict[str, Metric] = {}
+        self._lag_task: Optional[asyncio.Task] = None
+        self.span_seconds = self.histogram(
+            "flashback_span_duration_seconds", "Duration of traced calls", ("span",)
+        )
+        self.span_in_flight = self.gauge("flashback_span_in_flight", "Traced calls currently running", ("span",))
+        self.span_errors = self.counter("flashback_span_errors_total", "Traced calls that raised", ("span",))
+        self.loop_lag = self.histogram(
+            "flashback_event_loop_lag_seconds", "Delay of event loop wake-ups", buckets=LAG_BUCKETS
+        )
+
+    def _register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Metric:
+        return self._register(Metric("counter", name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Metric:
+        return self._register(Metric("gauge", name, help_text, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = None
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def span(self, name: str, **attributes: Any):
+        """Time a block; nested spans share the trace of the span that encloses them"""
+        if not self.enabled:
+            return _NO_SPAN
+        return _ActiveSpan(self, name, attributes)
+
+    def start(self):
+        """Sample event loop lag in the background"""
+        if self.enabled and (self._lag_task is None or self._lag_task.done()):
+            self._lag_task = asyncio.create_task(self._sample_loop_lag())
+
+    async def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            await asyncio.gather(self._lag_task, return_exceptions=True)
+            self._lag_task = None
+
+    async def _sample_loop_lag(self):
+        interval = settings.EVENT_LOOP_LAG_INTERVAL_SECONDS
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.loop_lag.observe(max(0.0, loop.time() - scheduled))
+
+
+# Create a singleton instance
+metrics = MetricsRegistry()
+
+# Sampled when /metrics is scraped
+queue_depth = metrics.gauge("flashback_queue_depth", "Items waiting per queue", ("queue",))
+jobs = metrics.gauge("flashback_jobs", "Background jobs by status", ("status",))
+cache_hits = metrics.counter("flashback_cache_hits_total", "Cache hits since startup", ("cache",))
+cache_misses = metrics.counter("flashback_cache_misses_total", "Cache misses since startup", ("cache",))
+cache_hit_ratio = metrics.gauge("flashback_cache_hit_ratio", "Cache hit ratio since startup", ("cache",))
+rate_limit_rate = metrics.gauge(
+    "flashback_rate_limit_requests_per_second", "Current adaptive request rate", ("provider",)
+)
+rate_limit_throttled = metrics.counter(
+    "flashback_rate_limit_throttled_total", "Provider answers with 429", ("provider",)
+)
+
+
+def traced(name: str):
+    """Wrap a function or coroutine function in a span; a no-op when metrics are disabled"""
+    def decorate(fn: Callable) -> Callable:
+        if not metrics.enabled:
+            return fn
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with metrics.span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with metrics.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def span(name: str, **attributes: Any):
+    """Context manager timing a block as a span of the metrics singleton"""
+    return metrics.span(name, **attributes)
+
+
+def log_event(event: str, **fields: Any):
+    """Print a JSON log line, tagged with the enclosing span when spans are logged"""
+    record = {"event": event, **fields}
+    current = _current_span.get()
+    if current is not None:
+        record["trace_id"] = current.trace_id
+        record["span_id"] = current.span_id
+    print(json.dumps(record, default=str))
@@ -0,0 +1,319 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from ..config import settings
+from ..models import Cue, Voiceover
+from .artifact_service import artifact_store
+from .db_service import db_service
+from .metrics_service import span
+from .subtitle_service import cues_from_script, merge_sentences, parse_subtitles
+
+EventCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# Files on disk referenced by each stage's checkpointed output
+FILE_STAGES = {
+    "voiceover": lambda output: [output[0]],
+    "images": lambda output: output,
+    "video": lambda output: [output],
+}
+
+
+@dataclass
+class Stage:
+    """A single step of a chapter pipeline"""
+    name: str
+    func: Callable[[Dict[str, Any]], Awaitable[Any]]
+    depends_on: List[str] = field(default_factory=list)
+
+
+class ChapterPipeline:
+    """DAG of stages for one chapter, run as soon as dependencies are met"""
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            for dep in stage.depends_on:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage {stage.name} depends on unknown stage {dep}")
+
+    def downstream(self, name: str) -> set:
+        """Every stage that directly or transitively depends on `name`"""
+        found = set()
+        pending = [name]
+        while pending:
+            current = pending.pop()
+            for stage in self.stages.values():
+                if current in stage.depends_on and stage.name not in found:
+                    found.add(stage.name)
+                    pending.append(stage.name)
+        return found
+
+    async def run(
+        self,
+        context: Dict[str, Any],
+        on_stage_complete: Optional[Callable[[str, Any, bool], Awaitable[None]]] = None,
+        completed: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Run every stage, passing results through `context` and reusing `completed` outputs"""
+        futures: Dict[str, asyncio.Task] = {}
+        completed = completed or {}
+
+        async def _run_stage(stage: Stage):
+            if stage.name in completed:
+                result = completed[stage.name]
+                context[stage.name] = result
+                if on_stage_complete:
+                    await on_stage_complete(stage.name, result, True)
+                return result
+            if stage.depends_on:
+                await asyncio.gather(*(futures[dep] for dep in stage.depends_on))
+            with span(f"stage.{stage.name}", task_id=context.get("task_id"), chapter=context.get("chapter_index")):
+                result = await stage.func(context)
+            context[stage.name] = result
+            if on_stage_complete:
+                await on_stage_complete(stage.name, result, False)
+            return result
+
+        for stage in self.stages.values():
+            futures[stage.name] = asyncio.create_task(_run_stage(stage))
+
+        try:
+            await asyncio.gather(*futures.values())
+        except BaseException:
+            for future in futures.values():
+                future.cancel()
+            await asyncio.gather(*futures.values(), return_exceptions=True)
+            raise
+
+        return context
+
+
+class PipelineScheduler:
+    """Run chapters concurrently with bounded per-provider concurrency"""
+
+    def __init__(self, ai_processor, video_processor, limits: Optional[Dict[str, int]] = None):
+        self.ai_processor = ai_processor
+        self.video_processor = video_processor
+        limits = limits or {
+            "chapter": settings.CHAPTER_CONCURRENCY,
+            "mistral": settings.MISTRAL_CONCURRENCY,
+            "elevenlabs": settings.ELEVEN_CONCURRENCY,
+            "gladia": settings.GLADIA_CONCURRENCY,
+            "seelab": settings.SEELAB_CONCURRENCY,
+        }
+        self._semaphores = {
+            provider: asyncio.Semaphore(max(1, limit))
+            for provider, limit in limits.items()
+        }
+
+    @asynccontextmanager
+    async def limit(self, provider: str):
+        """Hold one concurrency slot for the given provider"""
+        async with self._semaphores[provider]:
+            yield
+
+    def build_pipeline(self) -> ChapterPipeline:
+        """Build the stage DAG used for every chapter"""
+        return ChapterPipeline([
+            Stage("script", self._script),
+            Stage("voiceover", self._voiceover, ["script"]),
+            Stage("subtitles", self._subtitles, ["voiceover"]),
+            Stage("cues", self._cues, ["subtitles"]),
+            Stage("image_prompts", self._image_prompts, ["cues"]),
+            Stage("images", self._images, ["image_prompts"]),
+            Stage("video", self._video, ["voiceover", "cues", "images"]),
+        ])
+
+    async def run(
+        self,
+        task_id: str,
+        chapters: List[Dict[str, Any]],
+        content_type: str,
+        on_event: EventCallback,
+        chapter_offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Process every chapter, streaming progress events through `on_event`"""
+        send_lock = asyncio.Lock()
+        total = len(chapters)
+
+        async def emit(event: Dict[str, Any]):
+            # Websocket sends must not interleave
+            async with send_lock:
+                await on_event(event)
+
+        async def _process(idx: int, chapter: Dict[str, Any]):
+            chapter_index = chapter_offset + idx
+            chapter_path = artifact_store.task_path(task_id, f"chapter_{chapter_index}")
+
+            async with self.limit("chapter"):
+                await emit({
+                    "status": "processing",
+                    "chapter": idx + 1,
+                    "total_chapters": total
+                })
+
+                async def on_stage_complete(stage: str, result: Any, cached: bool):
+                    if not cached:
+                        # Record generated files in the task manifest before checkpointing
+                        if stage in FILE_STAGES:
+                            for path in FILE_STAGES[stage](result):
+                                await artifact_store.adopt(task_id, path)
+                        await db_service.store_stage_output(
+                            task_id, chapter_index, content_type, stage, result
+                        )
+                    await emit({
+                        "status": "stage_complete",
+                        "chapter": idx + 1,
+                        "stage": stage,
+                        "cached": cached
+                    })
+
+                context = {
+                    "task_id": task_id,
+                    "chapter_index": chapter_index,
+                    "chapter": chapter,
+                    "content_type": content_type,
+                    "task_path": chapter_path,
+                    "chapter_number": idx + 1,
+                    "emit": emit,
+                }
+                pipeline = self.build_pipeline()
+                try:
+                    completed = await self._load_checkpoints(pipeline, task_id, chapter_index, content_type)
+                    with span("pipeline.chapter", task_id=task_id, chapter=chapter_index):
+                        await pipeline.run(context, on_stage_complete, completed)
+                except Exception as e:
+                    print(f"Chapter {chapter_index} failed: {e}")
+                    context["error"] = str(e)
+                    await emit({
+                        "status": "chapter_error",
+                        "chapter": idx + 1,
+                        "chapter_title": chapter.get("title"),
+                        "message": str(e)
+                    })
+                    return context
+
+                await db_service.store_processed_chapter(
+                    task_id,
+                    chapter_index,
+                    context["script"],
+                    self._load_voiceover(context).path,
+                    context["video"]
+                )
+                await emit({
+                    "status": "chapter_complete",
+                    "chapter": idx + 1,
+                    "video_path": context["video"],
+                    "video_url": f"/api/videos/{task_id}/{chapter_index}",
+                    "chapter_title": chapter.get("title")
+                })
+                return context
+
+        return await asyncio.gather(*(
+            _process(idx, chapter) for idx, chapter in enumerate(chapters)
+        ))
+
+    async def _load_checkpoints(
+        self,
+        pipeline: ChapterPipeline,
+        task_id: str,
+        chapter_index: int,
+        content_type: str
+    ) -> Dict[str, Any]:
+        """Load reusable stage outputs, dropping stages whose files are gone and everything after them"""
+        completed = await db_service.get_stage_outputs(task_id, chapter_index, content_type)
+        for stage, stage_paths in FILE_STAGES.items():
+            if stage not in completed:
+                continue
+            paths = stage_paths(completed[stage])
+            if not all(isinstance(path, str) and os.path.exists(path) for path in paths):
+                completed.pop(stage)
+        for stage in list(pipeline.stages):
+            if stage not in completed:
+                for dependent in pipeline.downstream(stage):
+                    completed.pop(dependent, None)
+        return completed
+
+    @staticmethod
+    def _load_cues(ctx: Dict[str, Any]) -> List[Cue]:
+        # Checkpointed cues come back from JSON as plain lists
+        return [Cue(*cue) for cue in ctx["cues"]]
+
+    @staticmethod
+    def _load_voiceover(ctx: Dict[str, Any]) -> Voiceover:
+        return Voiceover(*ctx["voiceover"])
+
+    async def _script(self, ctx: Dict[str, Any]) -> str:
+        async with self.limit("mistral"):
+            return await self.ai_processor.generate_script(
+                ctx["chapter"].get("title"),
+                content_type=ctx["content_type"]
+            )
+
+    async def _voiceover(self, ctx: Dict[str, Any]) -> Voiceover:
+        async with self.limit("elevenlabs"):
+            return await self.ai_processor.generate_voiceover(ctx["script"], ctx["task_path"])
+
+    async def _subtitles(self, ctx: Dict[str, Any]) -> Any:
+        voiceover = self._load_voiceover(ctx)
+        if settings.SUBTITLE_TIMING == "gladia":
+            async with self.limit("gladia"):
+                return await self.ai_processor.generate_subtitles(voiceover.path)
+        # Word timings we already have: the TTS alignment, or an estimate from the script
+        if settings.SUBTITLE_TIMING == "alignment" and voiceover.alignment:
+            return voiceover.alignment
+        return cues_from_script(ctx["script"], voiceover.duration_ms)
+
+    async def _cues(self, ctx: Dict[str, Any]) -> List[Cue]:
+        # Parsed locally: one cue per sentence, with its timing kept for rendering
+        return merge_sentences(parse_subtitles(ctx["subtitles"]))
+
+    async def _image_prompts(self, ctx: Dict[str, Any]) -> List[str]:
+        async def _prepare(idx: int, sentence: str) -> str:
+            async with self.limit("mistral"):
+                prompt = await self.ai_processor.prepare_image_prompt(sentence)
+            await artifact_store.write_text(
+                ctx["task_id"], os.path.join(ctx["task_path"], f"image_prompt_{idx}.txt"), prompt
+            )
+            return prompt
+
+        return list(await asyncio.gather(*(
+            _prepare(idx, cue.text) for idx, cue in enumerate(self._load_cues(ctx))
+        )))
+
+    async def _images(self, ctx: Dict[str, Any]) -> List[str]:
+        async def _generate(idx: int, prompt: str) -> str:
+            filename = f"image_{idx}.png"
+            async with self.limit("seelab"):
+                await self.ai_processor.generate_image(prompt, filename, ctx["task_path"])
+            return os.path.join(ctx["task_path"], filename)
+
+        return list(await asyncio.gather(*(
+            _generate(idx, prompt) for idx, prompt in enumerate(ctx["image_prompts"])
+        )))
+
+    async def _video(self, ctx: Dict[str, Any]) -> str:
+        if not ctx["images"]:
+            raise ValueError("No images were generated for this chapter")
+        async def on_progress(progress: float):
+            await ctx["emit"]({
+                "status": "rendering",
+                "chapter": ctx["chapter_number"],
+                "progress": round(progress, 2)
+            })
+
+        # Rendering is bounded by the render pool; earlier chapters go first
+        voiceover = self._load_voiceover(ctx)
+        return await self.video_processor.create_video(
+            ctx["script"],
+            voiceover.path,
+            self._load_cues(ctx),
+            ctx["images"],
+            output_dir=ctx["task_path"],
+            priority=ctx["chapter_index"],
+            on_progress=on_progress,
+            duration_ms=voiceover.duration_ms
+        )
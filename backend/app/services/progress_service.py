@@ -0,0 +1,197 @@
+import asyncio
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from ..config import settings
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class ProgressStore:
+    """
+    In-memory task progress; every change bumps a version that watchers can wait on.
+    Tasks whose job runs in another process only know the status stored in the
+    database, re-read at most every PROGRESS_REFRESH_SECONDS.
+    """
+
+    def __init__(self, retention_seconds: float = None):
+        self.retention_seconds = retention_seconds or settings.PROGRESS_RETENTION_SECONDS
+        # Versions restart with the process, so ETags carry a per-process epoch
+        self.epoch = uuid.uuid4().hex[:8]
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._version = 0
+
+    def etag(self, snapshot: Dict[str, Any]) -> str:
+        return f'"{self.epoch}-{snapshot["version"]}"'
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Current progress snapshot, or None when this process knows nothing about the task"""
+        state = self._tasks.get(task_id)
+        if state is None:
+            return None
+        return {
+            "task_id": task_id,
+            "status": state["status"],
+            "progress": round(100 * state["done"] / state["total"]) if state["total"] else state["progress"],
+            "steps": [{"name": name, "status": status} for name, status in state["steps"].items()],
+            "message": state["message"],
+            "version": state["version"],
+        }
+
+    def needs_refresh(self, task_id: str) -> bool:
+        """Whether the database should be read again for this task"""
+        state = self._tasks.get(task_id)
+        if state is None:
+            return True
+        return not state["local"] and time.monotonic() - state["synced_at"] >= settings.PROGRESS_REFRESH_SECONDS
+
+    def seed(self, task_id: str, status: str):
+        """Remember a status read from the database; watchers only wake when it changed"""
+        state = self._state(task_id)
+        state["synced_at"] = time.monotonic()
+        if state["status"] != status or not state["version"]:
+            self.update(task_id, status=status)
+
+    def start(self, task_id: str, steps: List[str], total_units: int):
+        """Reset a task's progress for a new run over the given steps"""
+        state = self._state(task_id)
+        state.update(
+            local=True,
+            status="processing",
+            steps={name: "pending" for name in steps},
+            done=0,
+            total=total_units,
+            progress=0,
+            message=None,
+            finished_at=None
+        )
+        self._changed_state(task_id)
+
+    def update(
+        self,
+        task_id: str,
+        status: str = None,
+        step: str = None,
+        step_status: str = None,
+        advance: int = 0,
+        message: str = None,
+        total: int = None
+    ):
+        state = self._state(task_id)
+        if total is not None:
+            state["total"] = total
+        if status is not None:
+            state["status"] = status
+            if status == "completed":
+                state["done"] = state["total"]
+                state["progress"] = 100
+        if step is not None:
+            state["steps"][step] = step_status
+        if advance:
+            state["done"] = min(state["total"], state["done"] + advance)
+        if message is not None:
+            state["message"] = message
+        if state["status"] in TERMINAL_STATUSES + ("retrying",):
+            # The next attempt may run in another process
+            state["local"] = False
+        if state["status"] in TERMINAL_STATUSES:
+            state["finished_at"] = time.monotonic()
+            self._prune()
+        self._changed_state(task_id)
+
+    def forget(self, task_id: str):
+        """Drop a task's progress so the next read comes from the database"""
+        self._tasks.pop(task_id, None)
+        changed = self._changed.pop(task_id, None)
+        if changed is not None:
+            changed.set()
+
+    def record_event(self, task_id: str, event: Dict[str, Any]):
+        """Fold a pipeline event into the task's progress"""
+        status = event.get("status")
+        steps = list(self._state(task_id)["steps"])
+        chapter = event.get("chapter")
+        step = steps[chapter - 1] if chapter and 0 < chapter <= len(steps) else None
+
+        if status == "stage_complete":
+            self.update(task_id, step=step, step_status=event["stage"], advance=1)
+        elif status in ("processing", "rendering"):
+            self.update(task_id, step=step, step_status=status)
+        elif status == "chapter_complete":
+            self.update(task_id, step=step, step_status="completed")
+        elif status == "chapter_error":
+            self.update(task_id, step=step, step_status="failed", message=event.get("message"))
+        elif status in TERMINAL_STATUSES:
+            self.update(task_id, status=status, message=event.get("message"))
+
+    async def wait(self, task_id: str, version: int, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait until the task moves past `version`, returning the new snapshot or None on timeout"""
+        snapshot = self.get(task_id)
+        if snapshot is not None and snapshot["version"] != version:
+            return snapshot
+        changed = self._changed.setdefault(task_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self.get(task_id)
+
+    async def watch(
+        self,
+        task_id: str,
+        version: int = 0,
+        heartbeat: float = None
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Yield each new snapshot until the task finishes; None is yielded as a heartbeat"""
+        heartbeat = heartbeat or settings.STATUS_SSE_HEARTBEAT_SECONDS
+        while True:
+            snapshot = await self.wait(task_id, version, heartbeat)
+            if snapshot is None:
+                yield None
+                continue
+            version = snapshot["version"]
+            yield snapshot
+            if snapshot["status"] in TERMINAL_STATUSES:
+                return
+
+    def _state(self, task_id: str) -> Dict[str, Any]:
+        state = self._tasks.get(task_id)
+        if state is None:
+            state = {
+                "status": "pending",
+                "steps": {},
+                "done": 0,
+                "total": 0,
+                "progress": 0,
+                "message": None,
+                "version": 0,
+                "finished_at": None,
+                "local": False,
+                "synced_at": 0.0,
+            }
+            self._tasks[task_id] = state
+        return state
+
+    def _changed_state(self, task_id: str):
+        # Versions are global, so a reset task never repeats an old ETag
+        self._version += 1
+        self._tasks[task_id]["version"] = self._version
+        # Wake everyone waiting on the old version; later waiters get a fresh event
+        changed = self._changed.pop(task_id, None)
+        if changed is not None:
+            changed.set()
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.retention_seconds
+        expired = [
+            task_id for task_id, state in self._tasks.items()
+            if state["finished_at"] is not None and state["finished_at"] < cutoff
+        ]
+        for task_id in expired:
+            del self._tasks[task_id]
+
+
+# Create a singleton instance
+progress_store = ProgressStore()
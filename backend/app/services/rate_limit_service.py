@@ -0,0 +1,125 @@
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from ..config import settings
+from .metrics_service import span
+
+
+def _rate_limit_info(error: BaseException) -> Tuple[Optional[int], Optional[float]]:
+    """Find an HTTP status code and Retry-After delay anywhere in an exception chain"""
+    status_code = None
+    retry_after = None
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if status_code is None:
+            status_code = getattr(error, "status_code", None)
+        response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+        if response is not None:
+            if status_code is None:
+                status_code = getattr(response, "status_code", None)
+            headers = getattr(response, "headers", None) or {}
+            if retry_after is None and headers.get("retry-after"):
+                retry_after = _parse_retry_after(headers["retry-after"])
+        error = error.__cause__ or error.__context__
+    return status_code, retry_after
+
+
+def _parse_retry_after(value: str) -> Optional[float]:
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Token bucket whose rate adapts with AIMD: creep up on success, halve on 429"""
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int = None,
+        max_rate: float = None,
+        min_rate: float = None
+    ):
+        self.name = name
+        self.base_rate = rate
+        self.rate = rate
+        self.max_rate = max_rate or rate * settings.RATE_LIMIT_MAX_FACTOR
+        self.min_rate = min_rate or rate / 16
+        self.capacity = burst or max(1, int(rate))
+        self.throttled = 0
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait for a token; waiters are served in arrival order"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def on_success(self):
+        # Additive increase
+        self.rate = min(self.max_rate, self.rate + self.base_rate * settings.RATE_LIMIT_INCREASE)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        # Multiplicative decrease, and pause everyone for Retry-After
+        self.throttled += 1
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(self.min_rate, self.rate * settings.RATE_LIMIT_DECREASE)
+        self._tokens = 0
+        delay = retry_after if retry_after is not None else 1 / self.rate
+        self._blocked_until = max(self._blocked_until, now + delay)
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Run `fn` under the limiter, retrying when the provider answers 429"""
+        for attempt in range(settings.RATE_LIMIT_MAX_RETRIES + 1):
+            # Separate time spent waiting for a token from time spent in the provider
+            with span(f"{self.name}.throttle"):
+                await self.acquire()
+            try:
+                with span(f"{self.name}.request", attempt=attempt):
+                    result = await fn(*args, **kwargs)
+            except Exception as e:
+                status_code, retry_after = _rate_limit_info(e)
+                if status_code == 429 and attempt < settings.RATE_LIMIT_MAX_RETRIES:
+                    print(f"{self.name} rate limited, retrying (attempt {attempt + 1})")
+                    self.on_rate_limited(retry_after)
+                    continue
+                raise
+            self.on_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rate": self.rate, "throttled": self.throttled}
+
+
+# One limiter per provider, shared by every call site
+rate_limiters: Dict[str, RateLimiter] = {
+    "mistral": RateLimiter("mistral", settings.MISTRAL_RATE_LIMIT),
+    "elevenlabs": RateLimiter("elevenlabs", settings.ELEVEN_RATE_LIMIT),
+    "gladia": RateLimiter("gladia", settings.GLADIA_RATE_LIMIT),
+    "seelab": RateLimiter("seelab", settings.SEELAB_RATE_LIMIT),
+}
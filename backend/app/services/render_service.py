@@ -0,0 +1,179 @@
+import asyncio
+import itertools
+import os
+from typing import Awaitable, Callable, List, Optional
+
+from ..config import settings
+from .metrics_service import span
+
+ProgressCallback = Callable[[float], Awaitable[None]]
+
+
+class RenderJob:
+    """One ffmpeg invocation waiting in, or running on, the render pool"""
+
+    def __init__(
+        self,
+        command: List[str],
+        priority: int,
+        duration_ms: Optional[int],
+        on_progress: Optional[ProgressCallback]
+    ):
+        self.command = command
+        self.priority = priority
+        self.duration_ms = duration_ms
+        self.on_progress = on_progress
+        self.progress = 0.0
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.future.cancelled()
+
+    def cancel(self):
+        """Drop the job if queued, or kill its ffmpeg process if running"""
+        if not self.future.done():
+            self.future.cancel()
+        if self.process and self.process.returncode is None:
+            self.process.kill()
+
+
+class RenderPool:
+    """Run ffmpeg jobs as async subprocesses on a pool sized to the available cores"""
+
+    def __init__(self, workers: int = None, threads_per_job: int = None):
+        cpus = os.cpu_count() or 1
+        self.threads_per_job = threads_per_job or settings.RENDER_THREADS_PER_JOB or max(1, min(4, cpus))
+        self.workers = workers or settings.RENDER_WORKERS or max(1, cpus // self.threads_per_job)
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._counter = itertools.count()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._worker())
+                for _ in range(self.workers)
+            ]
+
+    def submit(
+        self,
+        command: List[str],
+        priority: int = 0,
+        duration_ms: Optional[int] = None,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> RenderJob:
+        """Queue an ffmpeg command ending with its output path; lower priority values run first"""
+        self._ensure_started()
+        job = RenderJob(command, priority, duration_ms, on_progress)
+        self._queue.put_nowait((priority, next(self._counter), job))
+        return job
+
+    async def render(
+        self,
+        command: List[str],
+        priority: int = 0,
+        duration_ms: Optional[int] = None,
+        on_progress: Optional[ProgressCallback] = None
+    ):
+        """Submit a command and wait for it; cancelling the caller cancels the render"""
+        job = self.submit(command, priority, duration_ms, on_progress)
+        try:
+            await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            job.cancel()
+            raise
+
+    async def stop(self):
+        """Cancel queued and running renders and stop the workers"""
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, _, job = self._queue.get_nowait()
+                job.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                if not job.cancelled:
+                    with span("ffmpeg.run"):
+                        await self._run(job)
+            except asyncio.CancelledError:
+                job.cancel()
+                raise
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: RenderJob):
+        # Machine-readable progress is a global option and goes first; the thread
+        # budget must sit right before the output path, otherwise ffmpeg applies
+        # it to the first input's decoder and the encoder picks its own count
+        threads = str(self.threads_per_job)
+        command = job.command[:1] + [
+            "-progress", "pipe:1",
+            "-nostats",
+        ] + job.command[1:-1] + [
+            "-threads", threads,
+            "-filter_complex_threads", threads,
+        ] + job.command[-1:]
+
+        job.process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        # Drain stderr concurrently so a chatty ffmpeg never blocks on a full pipe
+        stderr_task = asyncio.create_task(job.process.stderr.read())
+        try:
+            await self._read_progress(job)
+            returncode = await job.process.wait()
+            stderr = await stderr_task
+        except BaseException:
+            if job.process.returncode is None:
+                job.process.kill()
+                await job.process.wait()
+            stderr_task.cancel()
+            raise
+
+        if job.future.done():
+            return
+        if returncode != 0:
+            job.future.set_exception(
+                RuntimeError(f"ffmpeg failed: {stderr.decode(errors='replace')[-1000:]}")
+            )
+        else:
+            job.future.set_result(None)
+
+    async def _read_progress(self, job: RenderJob):
+        """Parse `key=value` blocks from ffmpeg's -progress output"""
+        async for raw_line in job.process.stdout:
+            key, _, value = raw_line.decode(errors="replace").strip().partition("=")
+            if key == "out_time_us" and job.duration_ms and value.isdigit():
+                progress = min(1.0, int(value) / 1000 / job.duration_ms)
+                # Only report meaningful steps
+                if progress - job.progress >= 0.05:
+                    job.progress = progress
+                    if job.on_progress:
+                        await job.on_progress(progress)
+            elif key == "progress" and value == "end":
+                job.progress = 1.0
+                if job.on_progress:
+                    await job.on_progress(1.0)
+
+
+# Create a singleton instance
+render_pool = RenderPool()
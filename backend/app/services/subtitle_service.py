@@ -0,0 +1,158 @@
+import json
+import re
+from typing import Any, Dict, List, Sequence, Union
+
+from ..models import Cue
+
+_TIMING_RE = re.compile(
+    r"(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{1,3})\s*-->\s*(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{1,3})"
+)
+_TAG_RE = re.compile(r"<[^>]*>|\{\\[^}]*\}")
+_SENTENCE_END = (".", "!", "?", "…", ".\"", "!\"", "?\"", "»")
+_CLAUSE_END = (",", ";", ":")
+# Extra characters' worth of time given to the pause after a sentence or clause
+_SENTENCE_PAUSE = 6
+_CLAUSE_PAUSE = 3
+
+
+def _to_ms(hours, minutes, seconds, fraction) -> int:
+    return (
+        int(hours or 0) * 3600000
+        + int(minutes) * 60000
+        + int(seconds) * 1000
+        + int(fraction.ljust(3, "0"))
+    )
+
+
+def parse_srt(content: str) -> List[Cue]:
+    """Parse SRT or WebVTT text into cues; indexes, headers, settings and tags are dropped"""
+    cues = []
+    start = end = None
+    text_lines: List[str] = []
+
+    for line in content.splitlines():
+        line = line.strip()
+        if "-->" in line:
+            match = _TIMING_RE.search(line)
+            if match:
+                if start is not None and text_lines:
+                    cues.append(Cue(start, end, " ".join(text_lines)))
+                groups = match.groups()
+                start = _to_ms(*groups[:4])
+                end = _to_ms(*groups[4:])
+                text_lines = []
+                continue
+        if not line:
+            if start is not None and text_lines:
+                cues.append(Cue(start, end, " ".join(text_lines)))
+            start = end = None
+            text_lines = []
+        elif start is not None:
+            text = _TAG_RE.sub("", line).strip()
+            if text:
+                text_lines.append(text)
+
+    if start is not None and text_lines:
+        cues.append(Cue(start, end, " ".join(text_lines)))
+    return cues
+
+
+parse_vtt = parse_srt
+
+
+def parse_gladia(result: Dict[str, Any]) -> List[Cue]:
+    """Turn a Gladia v2 transcription result into cues"""
+    transcription = (result.get("result") or result).get("transcription") or {}
+    utterances = transcription.get("utterances")
+    if utterances:
+        return [
+            Cue(int(round(u["start"] * 1000)), int(round(u["end"] * 1000)), u["text"].strip())
+            for u in utterances
+            if u.get("text", "").strip()
+        ]
+    for subtitles in transcription.get("subtitles") or []:
+        if subtitles.get("format") in ("srt", "vtt"):
+            return parse_srt(subtitles["subtitles"])
+    return []
+
+
+def parse_subtitles(subtitles: Union[str, Dict[str, Any], List[Any]]) -> List[Cue]:
+    """Parse SRT, VTT, Gladia JSON (as dict or text), or stored cue lists"""
+    if isinstance(subtitles, list):
+        return [Cue(*cue) for cue in subtitles]
+    if isinstance(subtitles, dict):
+        return parse_gladia(subtitles)
+    stripped = subtitles.lstrip()
+    if stripped.startswith("{"):
+        return parse_gladia(json.loads(stripped))
+    return parse_srt(subtitles)
+
+
+def cues_from_alignment(
+    characters: Sequence[str],
+    starts_s: Sequence[float],
+    ends_s: Sequence[float]
+) -> List[Cue]:
+    """Group per-character TTS timestamps (seconds) into one cue per word"""
+    cues = []
+    word: List[str] = []
+    start = end = 0.0
+    for char, char_start, char_end in zip(characters, starts_s, ends_s):
+        if char.isspace():
+            if word:
+                cues.append(Cue(int(round(start * 1000)), int(round(end * 1000)), "".join(word)))
+                word = []
+            continue
+        if not word:
+            start = char_start
+        word.append(char)
+        end = char_end
+    if word:
+        cues.append(Cue(int(round(start * 1000)), int(round(end * 1000)), "".join(word)))
+    return cues
+
+
+def cues_from_script(script: str, duration_ms: int) -> List[Cue]:
+    """Estimate word timings by spreading the script over the audio by character count"""
+    words = script.split()
+    if not words or duration_ms <= 0:
+        return []
+    weights = []
+    for word in words:
+        pause = 1
+        if word.endswith(_SENTENCE_END):
+            pause += _SENTENCE_PAUSE
+        elif word.endswith(_CLAUSE_END):
+            pause += _CLAUSE_PAUSE
+        weights.append((len(word), pause))
+    total = sum(spoken + pause for spoken, pause in weights)
+
+    cues = []
+    position = 0
+    for word, (spoken, pause) in zip(words, weights):
+        start = position * duration_ms // total
+        end = (position + spoken) * duration_ms // total
+        cues.append(Cue(start, end, word))
+        position += spoken + pause
+    return cues
+
+
+def merge_sentences(cues: List[Cue], max_chars: int = 200, max_duration_ms: int = 15000) -> List[Cue]:
+    """Join consecutive cues until a sentence ends, or the sentence gets too long"""
+    merged = []
+    current = None
+    for cue in cues:
+        if current is None:
+            current = cue
+        else:
+            current = Cue(current.start_ms, cue.end_ms, f"{current.text} {cue.text}")
+        if (
+            current.text.endswith(_SENTENCE_END)
+            or len(current.text) >= max_chars
+            or current.end_ms - current.start_ms >= max_duration_ms
+        ):
+            merged.append(current)
+            current = None
+    if current is not None:
+        merged.append(current)
+    return merged
@@ -1,156 +1,174 @@
-import ffmpeg
+import asyncio
+import os
+import uuid
+from typing import List, Optional, Sequence
+
+from ..config import settings
+from ..models import Cue
+from .metrics_service import traced
+from .render_service import ProgressCallback, render_pool
+
+
+def _format_srt_time(ms: int) -> str:
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02}:{minutes:02}:{seconds:02},{ms:03}"
+
+
+def _escape_filter_value(value: str) -> str:
+    # Quoted filter argument: only backslashes and quotes need escaping
+    return value.replace("\\", "\\\\").replace("'", "'\\''")
+
+
+def write_srt(cues: Sequence[Cue], path: str):
+    """Write cues as an SRT file for the subtitles filter"""
+    with open(path, "w", encoding="utf-8") as f:
+        for idx, cue in enumerate(cues, start=1):
+            f.write(f"{idx}\n{_format_srt_time(cue.start_ms)} --> {_format_srt_time(cue.end_ms)}\n{cue.text}\n\n")
+
+
+def image_timeline(image_count: int, cues: Sequence[Cue], duration_ms: Optional[int] = None) -> List[int]:
+    """Start time (ms) of each image, following cue timings when available"""
+    if image_count == 0:
+        return []
+    if cues:
+        # Spread the images over the cues in order; each image starts on a cue
+        starts = [cues[(k * len(cues)) // image_count].start_ms for k in range(image_count)]
+    elif duration_ms:
+        starts = [(k * duration_ms) // image_count for k in range(image_count)]
+    else:
+        starts = [0]
+    starts[0] = 0
+    # Drop images that would get no screen time
+    timeline = [starts[0]]
+    for start in starts[1:]:
+        if start > timeline[-1]:
+            timeline.append(start)
+    return timeline
+
 
 class VideoProcessor:
+    @traced("video.probe_duration")
+    async def probe_duration(self, media_path: str) -> float:
+        """Media duration in seconds, read with ffprobe"""
+        process = await asyncio.create_subprocess_exec(
+            settings.FFPROBE_BINARY,
+            "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            media_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"ffprobe failed: {stderr.decode(errors='replace')[-500:]}")
+        return float(stdout.decode().strip())
+
+    def build_command(
+        self,
+        audio_path: str,
+        image_paths: Sequence[str],
+        starts_ms: Sequence[int],
+        output_path: str,
+        subtitles_path: Optional[str] = None
+    ) -> List[str]:
+        """Build one ffmpeg invocation: image timeline, burned-in subtitles and audio"""
+        width, height, fps = settings.VIDEO_WIDTH, settings.VIDEO_HEIGHT, settings.VIDEO_FPS
+        command = [settings.FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error"]
+
+        for idx, image_path in enumerate(image_paths):
+            command += ["-loop", "1", "-framerate", str(fps)]
+            # The last image loops until the audio ends (-shortest)
+            if idx + 1 < len(starts_ms):
+                command += ["-t", f"{(starts_ms[idx + 1] - starts_ms[idx]) / 1000:.3f}"]
+            command += ["-i", image_path]
+        command += ["-i", audio_path]
+
+        filters = []
+        for idx in range(len(image_paths)):
+            filters.append(
+                f"[{idx}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps},format=yuv420p[v{idx}]"
+            )
+        inputs = "".join(f"[v{idx}]" for idx in range(len(image_paths)))
+        filters.append(f"{inputs}concat=n={len(image_paths)}:v=1:a=0[slides]")
+        if subtitles_path:
+            filters.append(
+                f"[slides]subtitles=filename='{_escape_filter_value(subtitles_path)}'"
+                f":force_style='{settings.SUBTITLE_STYLE}'[out]"
+            )
+        else:
+            filters.append("[slides]null[out]")
+
+        command += [
+            "-filter_complex", ";".join(filters),
+            "-map", "[out]",
+            "-map", f"{len(image_paths)}:a",
+            "-c:v", "libx264",
+            "-preset", settings.VIDEO_PRESET,
+            "-tune", "stillimage",
+            "-pix_fmt", "yuv420p",
+            "-r", str(fps),
+            "-c:a", "aac",
+            "-b:a", "192k",
+            "-shortest",
+        ]
+        if settings.VIDEO_MOVFLAGS:
+            command += ["-movflags", settings.VIDEO_MOVFLAGS]
+        command.append(output_path)
+        return command
+
+    @traced("video.create_video")
     async def create_video(
-        self, 
-        script: str, 
-        audio_path: str, 
-        subtitles: dict, 
-        image_path: str
+        self,
+        script: str,
+        audio_path: str,
+        cues: Sequence[Cue],
+        image_paths: Sequence[str],
+        output_dir: str,
+        priority: int = 0,
+        on_progress: Optional[ProgressCallback] = None,
+        duration_ms: Optional[int] = None
     ) -> str:
         """
-        Create a video by combining:
-        - Background image/visual
+        Create a video in a single ffmpeg pass by combining:
+        - Background images, each shown from the start of its cue
         - Audio voiceover
-        - Subtitles
+        - Burned-in subtitles
         """
-        output_path = f"/tmp/video_{uuid.uuid4()}.mp4"
-        
-        # Use ffmpeg to combine elements
-        # This is a simplified example - real implementation would be more complex
-        (
-            ffmpeg
-            .input(image_path, loop=1, framerate=1)
-            .input(audio_path)
-            .output(
-                output_path, 
-                vcodec='libx264', 
-                acodec='aac', 
-                shortest=None
+        if not image_paths:
+            raise ValueError("At least one image is required to render a video")
+
+        video_id = uuid.uuid4()
+        output_path = os.path.join(output_dir, f"video_{video_id}.mp4")
+        # Render under a temporary name so a partial file is never mistaken for a video
+        partial_path = os.path.join(output_dir, f"video_{video_id}.partial.mp4")
+
+        # Only probe the audio when the caller does not already know its length
+        if duration_ms is None and not cues and len(image_paths) > 1:
+            duration_ms = int(await self.probe_duration(audio_path) * 1000)
+        starts_ms = image_timeline(len(image_paths), cues, duration_ms)
+        image_paths = list(image_paths)[:len(starts_ms)]
+
+        subtitles_path = None
+        if cues:
+            subtitles_path = os.path.join(output_dir, f"video_{video_id}.srt")
+            await asyncio.to_thread(write_srt, cues, subtitles_path)
+
+        command = self.build_command(audio_path, image_paths, starts_ms, partial_path, subtitles_path)
+        try:
+            await render_pool.render(
+                command,
+                priority=priority,
+                duration_ms=cues[-1].end_ms if cues else duration_ms,
+                on_progress=on_progress
             )
-            .overwrite_output()
-            .run(capture_stdout=True, capture_stderr=True)
-        )
-        
+            os.replace(partial_path, output_path)
+        finally:
+            for path in (subtitles_path, partial_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+
         return output_path
-    
-        """ import os
-from pysrt import SubRipFile
-import datetime
-import subprocess
-
-# Paths
-base_path = os.path.dirname(__file__)
-srt_path = os.path.join(base_path, "transcript.srt")
-audio_path = os.path.join(base_path, "audio.mp3")
-pictures_path = os.path.join(base_path, "pictures")
-output_video_path = os.path.join(base_path, "video.mp4")
-process_folder = os.path.join(base_path, "process")
-
-# Load subtitles
-subtitles = SubRipFile.open(srt_path)
-
-def clean_text(text):
-    # Remove unwanted characters
-    # text = text.replace('\n', ' ')
-    text = text.replace(':', '\\:')
-    text = text.replace("'", "`")
-    if text.endswith(','):
-        text = text[:-1]  
-    
-    return text
-
-# Generate video segments
-segments = []
-for subtitle in subtitles:
-    start_time = subtitle.start.to_time()
-    end_time = subtitle.end.to_time()
-    
-    
-    # text = subtitle.text.replace('\n', ' ')
-    picture_file = os.path.join(pictures_path, f"{subtitle.index}.png")
-
-    if not os.path.exists(picture_file):
-        continue  # Skip if picture does not exist
-
-    # Create video segment with picture and subtitle
-    segment_output = os.path.join(process_folder, f"segment_{subtitle.index}.mp4")
-    duration = (datetime.datetime.combine(datetime.date.min, end_time) - datetime.datetime.combine(datetime.date.min, start_time)).total_seconds()
-    
-    
-    escaped_text = clean_text(subtitle.text)
-    
-    print(f"Creating segment {subtitle.index} with duration {duration} seconds")
-    # Create video using ffmpeg
-    command = [
-        'ffmpeg',
-        '-loop', '1',
-        # '-r', '25',
-        # '-pattern_type', 'glob',
-        '-i', picture_file,
-        '-t', f"{duration}",
-        # '-c:v', 'libx264',
-        '-tune', 'stillimage',
-        '-pix_fmt', 'yuv420p',
-        # '-shortest',
-        '-vf', f"drawtext=fontfile=font/Helvetica.ttf:text='{escaped_text}':fontcolor=white:fontsize=36:x=(w-text_w)/2:y=(h-text_h)-100",
-        segment_output,
-        '-y',  # Overwrite output file if it exists
-    ]
-    
-    subprocess.run(command, check=True)
-    
-    # segment = (
-    #     ffmpeg.input(picture_file, framerate=25, t=duration).video
-    #     .filter("scale", 1080, 1920)
-    #     .filter("setsar", 1)
-    # )
-    
-    
-    # segment = ffmpeg.drawtext(segment, text=text, fontfile="font/Helvetica.ttf", fontsize=36, fontcolor="white", x="(w-text_w)/2", y="h-100", box=1, boxcolor="black@0.5", boxborderw=5)
-        
-        
-        # .output(segment_output, vcodec="libx264", pix_fmt="yuv420p") \
-        # .run(overwrite_output=True)
-    segments.append(segment_output)
-
-
-#  Store the segments in a temporary file
-segments_file = os.path.join(process_folder, "segments.txt")
-with open(segments_file, 'w') as f:
-    for segment in segments:
-        f.write(f"file '{segment}'\n")
-
-
-# Add audio to the concatenated video
-# audio_input = ffmpeg.input(audio_path).audio
-
-# final_video = ffmpeg.concat(*segments, v=1, a=0).output(output_video_path, vcodec="libx264", acodec="aac", audio_bitrate="192k", format="mp4").run(overwrite_output=True)
-
-
-# Concatenate video segments
-command = [
-    'ffmpeg',
-    '-f', 'concat',
-    '-safe', '0',
-    '-i', segments_file,
-    '-i', audio_path,
-    '-c:a', 'aac',
-    '-b:a', '192k',
-    '-c:v', 'copy',
-    '-c:v', 'libx264',
-    '-tune', 'stillimage',
-    '-pix_fmt', 'yuv420p',
-    output_video_path,
-    '-y',  # Overwrite output file if it exists
-]
-
-subprocess.run(command, check=True)
-
-# Clean up temporary files
-for segment in segments:
-    os.remove(segment)
-    
-os.remove(segments_file)
-
-print(f"Final video saved at {output_video_path}") """
\ No newline at end of file
@@ -0,0 +1,48 @@
+"""
+Benchmark per-call Agent construction against the prebuilt agent registry.
+
+Runs offline against pydantic-ai's TestModel, so only local overhead is measured.
+
+    python -m benchmarks.bench_agents [iterations]
+"""
+import asyncio
+import sys
+import time
+import timeit
+
+from pydantic_ai import Agent
+from pydantic_ai.models.test import TestModel
+
+from app.services.agent_service import AGENT_SPECS, AgentRegistry
+
+
+def build_agent(model, name: str) -> Agent:
+    spec = AGENT_SPECS[name]
+    return Agent(model, result_type=spec.result_type, system_prompt=spec.system_prompt)
+
+
+async def run_calls(iterations: int, get_agent) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await get_agent().run("Le plan Marshall")
+    return time.perf_counter() - start
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    model = TestModel()
+    registry = AgentRegistry(model)
+
+    per_call = timeit.timeit(lambda: build_agent(model, "KeyMoment"), number=iterations)
+    lookup = timeit.timeit(lambda: registry.get("KeyMoment"), number=iterations)
+    print(f"construct: {per_call / iterations * 1e6:.1f} us/call")
+    print(f"registry:  {lookup / iterations * 1e6:.2f} us/call")
+
+    run_per_call = asyncio.run(run_calls(iterations, lambda: build_agent(model, "KeyMoment")))
+    run_registry = asyncio.run(run_calls(iterations, lambda: registry.get("KeyMoment")))
+    print(f"run, constructed per call: {run_per_call / iterations * 1e6:.1f} us/call")
+    print(f"run, from registry:        {run_registry / iterations * 1e6:.1f} us/call")
+
+
+if __name__ == "__main__":
+    main()
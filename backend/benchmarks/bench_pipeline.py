@@ -0,0 +1,320 @@
+"""
+End-to-end pipeline benchmark against local provider fakes (no network, no API keys).
+
+Generates synthetic PDFs, starts benchmarks.fake_providers, then for each
+concurrency level runs upload -> subjects -> script -> voiceover -> subtitles
+-> images -> video for every document, in a fresh process with its own
+database, artifacts and caches. Reports throughput, p50/p95 per stage, errors
+and peak RSS. Provider options are passed through to the fakes.
+
+    python -m benchmarks.bench_pipeline [--concurrency 1,2,4] [--documents N] [--chapters 2]
+        [--pages 4] [--video-size 540x960] [--latency seelab=2] [--error-rate 0.05]
+        [--rate-limit mistral=5] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.fake_providers import add_arguments
+
+BACKEND_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
+
+FILLER = (
+    "Ce passage décrit le contexte politique, économique et social de la période. "
+    "Les historiens s'appuient sur des archives, des lettres et des témoignages pour le reconstituer. "
+)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def make_pdf(path: str, document: int, chapters: int, pages: int):
+    """A PDF whose chapters are headed "Sujet <document>-<chapter>", spread over `pages` pages"""
+    import pymupdf
+
+    pdf = pymupdf.open()
+    pages = max(pages, chapters)
+    previous_chapter = 0
+    for page_number in range(pages):
+        page = pdf.new_page()
+        y = 72
+        chapter = page_number * chapters // pages + 1
+        if chapter != previous_chapter:
+            page.insert_text((72, y), f"Sujet {document}-{chapter}", fontsize=20)
+            previous_chapter = chapter
+            y += 40
+        page.insert_textbox(pymupdf.Rect(72, y, 523, 770), FILLER * 12, fontsize=11)
+    pdf.save(path)
+    pdf.close()
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "app": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        "ffmpeg": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+async def run_level(pdfs: List[str], concurrency: int, content_type: str) -> Dict[str, Any]:
+    """Push every PDF through the app in this process, `concurrency` documents at a time"""
+    from app import main
+    from app.services.job_service import job_queue
+
+    await main.app.router.startup()
+    depends_on = {name: stage.depends_on for name, stage in main.pipeline_scheduler.build_pipeline().stages.items()}
+    durations: Dict[str, List[float]] = defaultdict(list)
+    counts = defaultdict(int)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(client: httpx.AsyncClient, pdf: str):
+        async with semaphore:
+            started = time.perf_counter()
+            with open(pdf, "rb") as f:
+                data = f.read()
+            response = await client.post("/api/upload", files={"file": (os.path.basename(pdf), data, "application/pdf")})
+            if response.status_code != 200:
+                print(f"Upload of {pdf} failed: {response.text}", file=sys.stderr)
+                counts["failed_documents"] += 1
+                return
+            durations["upload"].append(time.perf_counter() - started)
+            task = response.json()
+
+            # Same job the /ws/process websocket enqueues
+            job_id = await job_queue.enqueue(
+                "process_chapters",
+                {
+                    "task_id": task["task_id"],
+                    "content_type": content_type,
+                    "start_chapter": 0,
+                    "end_chapter": len(task["chapters"]) - 1,
+                },
+                task_id=task["task_id"]
+            )
+            chapter_started: Dict[int, float] = {}
+            stage_ended: Dict[int, Dict[str, float]] = defaultdict(dict)
+            completed_chapters = set()
+            async for event in job_queue.subscribe(job_id):
+                now = time.perf_counter()
+                chapter = event.get("chapter")
+                status = event.get("status")
+                if status == "processing":
+                    chapter_started[chapter] = now
+                    stage_ended[chapter].clear()
+                elif status == "stage_complete":
+                    stage = event["stage"]
+                    stage_ended[chapter][stage] = now
+                    if not event.get("cached"):
+                        # A stage starts once its last dependency is done
+                        ready = max(
+                            [chapter_started[chapter]] +
+                            [stage_ended[chapter].get(dep, 0.0) for dep in depends_on[stage]]
+                        )
+                        durations[stage].append(now - ready)
+                elif status == "chapter_complete":
+                    # Retried jobs replay finished chapters from their checkpoints
+                    if chapter not in completed_chapters:
+                        completed_chapters.add(chapter)
+                        durations["chapter"].append(now - chapter_started[chapter])
+                        counts["chapters"] += 1
+                elif status == "chapter_error":
+                    counts["chapter_errors"] += 1
+                elif status == "retrying":
+                    counts["retries"] += 1
+
+            job = await job_queue.get_job(job_id)
+            if job["status"] == "completed":
+                durations["document"].append(time.perf_counter() - started)
+                counts["documents"] += 1
+            else:
+                counts["failed_documents"] += 1
+
+    started = time.perf_counter()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            await asyncio.gather(*(process(client, pdf) for pdf in pdfs))
+    finally:
+        await main.app.router.shutdown()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "elapsed": elapsed,
+        "counts": dict(counts),
+        "stages": {
+            stage: {
+                "n": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+            }
+            for stage, values in durations.items()
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def worker(args: argparse.Namespace):
+    pdfs = sorted(os.path.join(args.pdf_dir, name) for name in os.listdir(args.pdf_dir))[:args.documents]
+    result = asyncio.run(run_level(pdfs, args.worker_concurrency, args.content_type))
+    with open(args.result, "w") as f:
+        json.dump(result, f)
+
+
+def start_fake_providers(args: argparse.Namespace, port: int) -> subprocess.Popen:
+    command = [sys.executable, "-m", "benchmarks.fake_providers", "--port", str(port),
+               "--jitter", str(args.jitter), "--audio-seconds", str(args.audio_seconds)]
+    for option in ("latency", "error_rate", "rate_limit"):
+        for value in getattr(args, option) or []:
+            command += [f"--{option.replace('_', '-')}", value]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Fake providers exited during startup")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/_health").raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Fake providers did not start")
+
+
+def level_env(workdir: str, port: int, concurrency: int, video_size: str) -> Dict[str, str]:
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "MISTRAL_API_KEY": "bench",
+        "MISTRAL_AGENT_IMAGE_PROMPT": "bench-image-prompt",
+        "ELEVEN_API_KEY": "bench",
+        "GLADIA_API_KEY": "bench",
+        "SEELAB_API_KEY": "bench",
+        "MISTRAL_BASE_URL": base_url,
+        "ELEVEN_BASE_URL": base_url,
+        "GLADIA_BASE_URL": f"{base_url}/gladia/",
+        "SEELAB_BASE_URL": f"{base_url}/seelab/",
+        "DB_PATH": os.path.join(workdir, "tasks.db"),
+        "ARTIFACT_DIR": os.path.join(workdir, "artifacts"),
+        "ASSET_CACHE_DIR": os.path.join(workdir, "cache"),
+        "JOB_WORKERS": str(concurrency),
+    }
+    if video_size:
+        width, height = video_size.lower().split("x")
+        env.update(VIDEO_WIDTH=width, VIDEO_HEIGHT=height)
+    return env
+
+
+def report(result: Dict[str, Any], providers: Dict[str, Dict[str, int]]):
+    counts = result["counts"]
+    documents = counts.get("documents", 0)
+    failed = counts.get("failed_documents", 0)
+    chapters = counts.get("chapters", 0)
+    minutes = result["elapsed"] / 60
+    rss = result["peak_rss_mb"]
+    print(f"\nconcurrency {result['concurrency']}: {documents + failed} documents, "
+          f"{chapters} chapters in {result['elapsed']:.1f} s")
+    print(f"  throughput: {documents / minutes:.2f} documents/min, {chapters / minutes:.2f} chapters/min")
+    print(f"  errors: {failed} failed documents, {counts.get('chapter_errors', 0)} chapter errors, "
+          f"{counts.get('retries', 0)} job retries")
+    print(f"  peak RSS: app {rss['app']:.0f} MB, ffmpeg {rss['ffmpeg']:.0f} MB")
+    print(f"  {'stage':<14}{'n':>5}{'p50 s':>9}{'p95 s':>9}")
+    for stage, stats in result["stages"].items():
+        print(f"  {stage:<14}{stats['n']:>5}{stats['p50']:>9.2f}{stats['p95']:>9.2f}")
+    print("  providers: " + ", ".join(
+        f"{name} {stats['requests']} calls ({stats['rate_limited']} throttled, {stats['errors']} failed)"
+        for name, stats in providers.items()
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,2,4", help="comma-separated documents in flight")
+    parser.add_argument("--documents", type=int, default=0, help="documents per level (default 2 x concurrency)")
+    parser.add_argument("--chapters", type=int, default=2, help="chapters per document")
+    parser.add_argument("--pages", type=int, default=4, help="pages per document")
+    parser.add_argument("--content-type", default="KeyMoment")
+    parser.add_argument("--video-size", help="WIDTHxHEIGHT, defaults to the app's settings")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory")
+    parser.add_argument("--verbose", action="store_true", help="show the app's output")
+    add_arguments(parser)
+    # Internal: run one level in a child process
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-concurrency", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--pdf-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    max_documents = args.documents or 2 * max(levels)
+    workdir = tempfile.mkdtemp(prefix="flashback-bench-")
+    pdf_dir = os.path.join(workdir, "pdfs")
+    os.makedirs(pdf_dir)
+    for document in range(max_documents):
+        make_pdf(os.path.join(pdf_dir, f"document_{document:03d}.pdf"), document, args.chapters, args.pages)
+
+    fakes = start_fake_providers(args, args.port)
+    results = []
+    try:
+        for concurrency in levels:
+            level_dir = os.path.join(workdir, f"level_{concurrency}")
+            os.makedirs(level_dir)
+            result_path = os.path.join(level_dir, "result.json")
+            before = httpx.get(f"http://127.0.0.1:{args.port}/_stats").json()
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_pipeline", "--worker",
+                 "--worker-concurrency", str(concurrency),
+                 "--documents", str(args.documents or 2 * concurrency),
+                 "--content-type", args.content_type,
+                 "--pdf-dir", pdf_dir, "--result", result_path],
+                cwd=BACKEND_DIR,
+                env=level_env(level_dir, args.port, concurrency, args.video_size),
+                stdout=None if args.verbose else subprocess.DEVNULL,
+                check=True
+            )
+            after = httpx.get(f"http://127.0.0.1:{args.port}/_stats").json()
+            providers = {
+                name: {key: after[name][key] - before[name][key] for key in stats}
+                for name, stats in after.items()
+            }
+            with open(result_path) as f:
+                result = json.load(f)
+            result["providers"] = providers
+            results.append(result)
+            report(result, providers)
+    finally:
+        fakes.terminate()
+        fakes.wait()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark cold start: importing app.main in a fresh interpreter, and warming up providers.
+
+    python -m benchmarks.bench_startup [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ("mistralai", "elevenlabs", "pydantic_ai", "pymupdf", "pymupdf4llm")
+
+PROBE = """
+import json, sys, time
+heavy = %r
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+loaded = [name for name in heavy if name in sys.modules]
+app.main.ai_processor.warm_up()
+warmed = time.perf_counter()
+print(json.dumps({"import": imported - start, "warm_up": warmed - imported, "loaded": loaded}))
+""" % (HEAVY_MODULES,)
+
+# Startup must not need real keys; warm-up only builds clients
+DUMMY_ENV = {
+    "MISTRAL_API_KEY": "bench",
+    "ELEVEN_API_KEY": "bench",
+}
+
+
+def probe(backend_dir: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=backend_dir,
+        env={**DUMMY_ENV, **os.environ},
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    backend_dir = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
+
+    results = [probe(backend_dir) for _ in range(runs)]
+    import_times = [r["import"] for r in results]
+    warm_times = [r["warm_up"] for r in results]
+
+    print(f"import app.main: median {statistics.median(import_times) * 1000:.0f} ms, "
+          f"min {min(import_times) * 1000:.0f} ms over {runs} runs")
+    print(f"warm_up:         median {statistics.median(warm_times) * 1000:.0f} ms")
+    print(f"heavy modules loaded at import: {', '.join(results[0]['loaded']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Benchmark the local subtitle parser.
+
+    python -m benchmarks.bench_subtitles [path/to/file.srt] [iterations]
+"""
+import os
+import sys
+import timeit
+
+from app.services.subtitle_service import merge_sentences, parse_subtitles
+
+DEFAULT_SAMPLE = os.path.normpath(
+    os.path.join(os.path.dirname(__file__), "..", "artifacts", "sample", "test.srt")
+)
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SAMPLE
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+
+    cues = parse_subtitles(content)
+    sentences = merge_sentences(cues)
+    parse_time = timeit.timeit(lambda: parse_subtitles(content), number=iterations)
+    merge_time = timeit.timeit(lambda: merge_sentences(cues), number=iterations)
+
+    print(f"{path}: {len(cues)} cues, {len(sentences)} sentences")
+    print(f"parse: {parse_time / iterations * 1e6:.1f} us/file")
+    print(f"merge: {merge_time / iterations * 1e6:.1f} us/file")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Local fakes of the Mistral, ElevenLabs, Gladia and Seelab APIs for offline benchmarks.
+
+Every provider answers after an injected latency, fails a fraction of its
+requests with 500 and enforces a token-bucket rate limit (429 + Retry-After).
+Settings take one value for every provider or provider=value overrides.
+
+    python -m benchmarks.fake_providers [--port 8765] [--latency 0.5] [--latency seelab=2]
+        [--jitter 0.3] [--error-rate 0.02] [--rate-limit mistral=5] [--audio-seconds 6]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import re
+import subprocess
+import tempfile
+import time
+import uuid
+from typing import Dict, List, NamedTuple, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from app.config import settings
+
+PROVIDERS = ("mistral", "elevenlabs", "gladia", "seelab")
+
+DEFAULT_LATENCY = {"mistral": 0.4, "elevenlabs": 0.8, "gladia": 0.3, "seelab": 1.5}
+
+# Synthetic documents name their chapters "Sujet <document>-<chapter>"
+SUBJECT_PATTERN = re.compile(r"Sujet \d+-\d+")
+
+SCRIPT_SENTENCES = [
+    "En {year}, {subject} change le cours de l'histoire.",
+    "Les témoins de l'époque racontent une période de grands bouleversements.",
+    "Des figures célèbres prennent alors des décisions courageuses.",
+    "Aujourd'hui encore, on étudie {subject} à l'école.",
+    "Retiens bien cette date et partage la avec tes amis.",
+]
+
+
+class ProviderProfile(NamedTuple):
+    latency: float
+    error_rate: float = 0.0
+    rate_limit: float = 0.0  # requests per second, 0 for unlimited
+
+
+class FakeProvider:
+    """Latency, random failures and a token bucket in front of one provider's endpoints"""
+
+    def __init__(self, name: str, profile: ProviderProfile, jitter: float):
+        self.name = name
+        self.profile = profile
+        self.jitter = jitter
+        self.capacity = max(1.0, profile.rate_limit)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self.stats = {"requests": 0, "rate_limited": 0, "errors": 0}
+
+    def _take_token(self) -> Optional[float]:
+        """Consume a token, or return how long until one is available"""
+        if not self.profile.rate_limit:
+            return None
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.profile.rate_limit)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return None
+        return (1 - self._tokens) / self.profile.rate_limit
+
+    async def admit(self) -> Optional[Response]:
+        """Wait out the injected latency; return an error response when the call should fail"""
+        self.stats["requests"] += 1
+        retry_after = self._take_token()
+        if retry_after is not None:
+            self.stats["rate_limited"] += 1
+            return JSONResponse(
+                {"message": "Rate limit exceeded"},
+                status_code=429,
+                headers={"Retry-After": f"{retry_after:.3f}"}
+            )
+        latency = self.profile.latency * random.uniform(1 - self.jitter, 1 + self.jitter)
+        await asyncio.sleep(max(0.0, latency))
+        if random.random() < self.profile.error_rate:
+            self.stats["errors"] += 1
+            return JSONResponse({"message": "Injected failure"}, status_code=500)
+        return None
+
+
+def make_assets(workdir: str, audio_seconds: float) -> Dict[str, bytes]:
+    """Render a constant-bitrate mp3 (matching ELEVEN_OUTPUT_FORMAT) and a PNG with ffmpeg"""
+    sample_rate, bitrate = settings.ELEVEN_OUTPUT_FORMAT.split("_")[1:]
+    audio_path = os.path.join(workdir, "speech.mp3")
+    image_path = os.path.join(workdir, "image.png")
+    subprocess.run([
+        settings.FFMPEG_BINARY, "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=220:duration={audio_seconds}",
+        "-ar", sample_rate, "-ac", "1", "-b:a", f"{bitrate}k",
+        "-write_xing", "0", "-id3v2_version", "0",
+        audio_path,
+    ], check=True)
+    subprocess.run([
+        settings.FFMPEG_BINARY, "-y", "-v", "error",
+        "-f", "lavfi", "-i", "testsrc=size=1024x1024:rate=1",
+        "-frames:v", "1",
+        image_path,
+    ], check=True)
+    with open(audio_path, "rb") as f:
+        audio = f.read()
+    with open(image_path, "rb") as f:
+        image = f.read()
+    return {"audio": audio, "image": image}
+
+
+def _last_user_message(body: dict) -> str:
+    content = body["messages"][-1].get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def _completion(body: dict, content: Optional[str] = None, tool_calls: List[dict] = None) -> dict:
+    return {
+        "id": uuid.uuid4().hex,
+        "object": "chat.completion",
+        "model": body.get("model") or "fake",
+        "created": int(time.time()),
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        "choices": [{
+            "index": 0,
+            "finish_reason": "tool_calls" if tool_calls else "stop",
+            "message": {"role": "assistant", "content": content or "", "tool_calls": tool_calls},
+        }],
+    }
+
+
+def _script(subject: str) -> str:
+    year = 1800 + sum(map(ord, subject)) % 200
+    return " ".join(sentence.format(subject=subject, year=year) for sentence in SCRIPT_SENTENCES)
+
+
+def create_app(
+    profiles: Dict[str, ProviderProfile],
+    jitter: float,
+    assets: Dict[str, bytes],
+    base_url: str
+) -> FastAPI:
+    providers = {name: FakeProvider(name, profiles[name], jitter) for name in PROVIDERS}
+    audio_seconds = len(assets["audio"]) * 8 / (int(settings.ELEVEN_OUTPUT_FORMAT.rsplit("_", 1)[-1]) * 1000)
+    app = FastAPI()
+
+    @app.get("/_health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/_stats")
+    async def stats():
+        return {name: provider.stats for name, provider in providers.items()}
+
+    # Mistral: chat completions back the pydantic-ai agents, agent completions the image prompts
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        error = await providers["mistral"].admit()
+        if error:
+            return error
+        body = await request.json()
+        message = _last_user_message(body)
+        tools = body.get("tools")
+        if tools:
+            # Structured results are returned through the result tool
+            function = tools[0]["function"]
+            subjects = list(dict.fromkeys(SUBJECT_PATTERN.findall(message)))
+            arguments = subjects
+            if "response" in function.get("parameters", {}).get("properties", {}):
+                arguments = {"response": subjects}
+            return _completion(body, tool_calls=[{
+                "id": uuid.uuid4().hex[:9],
+                "type": "function",
+                "function": {"name": function["name"], "arguments": json.dumps(arguments, ensure_ascii=False)},
+            }])
+        subject = (SUBJECT_PATTERN.findall(message) or [message[:40]])[0]
+        return _completion(body, content=_script(subject))
+
+    @app.post("/v1/agents/completions")
+    async def agent(request: Request):
+        error = await providers["mistral"].admit()
+        if error:
+            return error
+        body = await request.json()
+        return _completion(body, content=f"Illustration réaliste : {_last_user_message(body)[:120]}")
+
+    # ElevenLabs: the same clip for every request, with characters spread evenly over it
+    @app.post("/v1/text-to-speech/{voice_id}/stream/with-timestamps")
+    async def speech_with_timestamps(voice_id: str, request: Request):
+        error = await providers["elevenlabs"].admit()
+        if error:
+            return error
+        text = (await request.json())["text"]
+        step = audio_seconds / max(1, len(text))
+        audio = assets["audio"]
+
+        async def chunks():
+            half_text = len(text) // 2
+            half_audio = len(audio) // 2
+            for (start, end), (audio_start, audio_end) in (
+                ((0, half_text), (0, half_audio)),
+                ((half_text, len(text)), (half_audio, len(audio))),
+            ):
+                yield json.dumps({
+                    "audio_base64": base64.b64encode(audio[audio_start:audio_end]).decode(),
+                    "alignment": {
+                        "characters": list(text[start:end]),
+                        "character_start_times_seconds": [i * step for i in range(start, end)],
+                        "character_end_times_seconds": [(i + 1) * step for i in range(start, end)],
+                    },
+                }) + "\n"
+
+        return StreamingResponse(chunks(), media_type="application/json")
+
+    @app.post("/v1/text-to-speech/{voice_id}")
+    @app.post("/v1/text-to-speech/{voice_id}/stream")
+    async def speech(voice_id: str):
+        error = await providers["elevenlabs"].admit()
+        if error:
+            return error
+        return Response(assets["audio"], media_type="audio/mpeg")
+
+    # Gladia: transcriptions are done by the first poll
+    @app.post("/gladia/upload")
+    async def gladia_upload(audio: UploadFile):
+        error = await providers["gladia"].admit()
+        if error:
+            return error
+        await audio.read()
+        return {"audio_url": f"{base_url}/gladia/audio/{uuid.uuid4().hex}"}
+
+    @app.post("/gladia/pre-recorded")
+    async def gladia_transcribe():
+        error = await providers["gladia"].admit()
+        if error:
+            return error
+        job_id = uuid.uuid4().hex
+        return {"id": job_id, "result_url": f"{base_url}/gladia/pre-recorded/{job_id}"}
+
+    @app.get("/gladia/pre-recorded/{job_id}")
+    async def gladia_result(job_id: str):
+        utterances = [
+            {"start": start, "end": min(audio_seconds, start + 2), "text": f"Phrase {index + 1}."}
+            for index, start in enumerate(range(0, max(1, int(audio_seconds)), 2))
+        ]
+        return {"status": "done", "result": {"transcription": {"utterances": utterances}}}
+
+    # Seelab: image URLs point at a latency-free CDN route
+    @app.post("/seelab/predict/text-to-image")
+    async def seelab():
+        error = await providers["seelab"].admit()
+        if error:
+            return error
+        return {"result": {"image": [{"url": f"{base_url}/cdn/{uuid.uuid4().hex}.png"}]}}
+
+    @app.get("/cdn/{name}")
+    async def cdn(name: str):
+        return Response(assets["image"], media_type="image/png")
+
+    return app
+
+
+def parse_overrides(values: List[str], defaults: Dict[str, float]) -> Dict[str, float]:
+    """Turn ["0.5", "seelab=2"] into a value per provider"""
+    result = dict(defaults)
+    for value in values or []:
+        if "=" in value:
+            name, number = value.split("=", 1)
+            if name not in PROVIDERS:
+                raise ValueError(f"Unknown provider {name!r}, expected one of {', '.join(PROVIDERS)}")
+            result[name] = float(number)
+        else:
+            result = {name: float(value) for name in PROVIDERS}
+    return result
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", action="append", help="seconds per call (default mistral=0.4 "
+                        "elevenlabs=0.8 gladia=0.3 seelab=1.5)")
+    parser.add_argument("--jitter", type=float, default=0.3, help="latency varies by +/- this fraction")
+    parser.add_argument("--error-rate", action="append", help="fraction of calls answered with 500")
+    parser.add_argument("--rate-limit", action="append", help="requests per second, 0 for unlimited")
+    parser.add_argument("--audio-seconds", type=float, default=6, help="length of every voiceover")
+
+
+def profiles_from_args(args: argparse.Namespace) -> Dict[str, ProviderProfile]:
+    latency = parse_overrides(args.latency, DEFAULT_LATENCY)
+    error_rate = parse_overrides(args.error_rate, {name: 0.0 for name in PROVIDERS})
+    rate_limit = parse_overrides(args.rate_limit, {name: 0.0 for name in PROVIDERS})
+    return {name: ProviderProfile(latency[name], error_rate[name], rate_limit[name]) for name in PROVIDERS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="fake-providers-") as workdir:
+        assets = make_assets(workdir, args.audio_seconds)
+    app = create_app(profiles_from_args(args), args.jitter, assets, f"http://{args.host}:{args.port}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()